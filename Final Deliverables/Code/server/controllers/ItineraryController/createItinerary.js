@@ -4,6 +4,7 @@
 import { Itinerary } from "../../models/Itinerary.js";
 import { spawn } from "child_process";
 import { SUCCESS_MESSAGES, ERROR_MESSAGES } from "../../utils/constants.js";
+import { useLlmServerRender, sendLlmServerRender } from "../../utils/itineraryRenderUtils.js";
 import fs from "fs";
 
 const normalizeTime = (hours, minutes) => {
@@ -55,6 +56,11 @@ const createItinerary = async (req, res) => {
         const newItinerary = await Itinerary.create({ destinations: sortedDestinations });
         const formattedItineraryJSON = JSON.stringify(formattedItinerary);
 
+        if (useLlmServerRender()) {
+            return await sendLlmServerRender("/itinerary/render", { itinerary: formattedItinerary, template_id: template_id.toString() }, res);
+        }
+
+        // Fallback: render with a one-off Python process
         const pythonScriptPath = "./llm_component/basic_itinerary.py";
         const pythonProcess = spawn("python", [pythonScriptPath, formattedItineraryJSON, template_id.toString()]);
 
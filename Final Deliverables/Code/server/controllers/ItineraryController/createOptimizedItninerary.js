@@ -3,6 +3,7 @@
 */
 import { SUCCESS_MESSAGES, ERROR_MESSAGES } from "../../utils/constants.js";
 import { spawn } from "child_process";
+import { useLlmServerRender, sendLlmServerRender } from "../../utils/itineraryRenderUtils.js";
 import fs from "fs";
 
 const createOptimizedItinerary = async (req, res) => {
@@ -12,6 +13,11 @@ const createOptimizedItinerary = async (req, res) => {
         return res.status(400).json({ message: "Missing 'query' or 'template' in request body" });
     }
     try {
+        if (useLlmServerRender()) {
+            return await sendLlmServerRender("/itinerary/renderAiItinerary", { query, template_id: template_id.toString() }, res);
+        }
+
+        // Fallback: render with a one-off Python process
         const pythonScriptPath = "./llm_component/ai_itinerary_components.py";
         const pythonProcess = spawn("python", [pythonScriptPath, query, template_id.toString()]);
 
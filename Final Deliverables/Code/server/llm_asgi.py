@@ -0,0 +1,230 @@
+"""ASGI version of llm_server.py: the same /api/llm routes on an event loop.
+
+Validation, response bodies and metrics come from llm_component/api.py, which
+llm_server.py uses too; the routes here only differ in awaiting the work.
+
+The summary and AI itinerary routes await MongoDB (pymongo's AsyncMongoClient)
+and the LLM providers (ChatGroq.ainvoke, AsyncAzureOpenAI) instead of blocking a
+thread, so one process can hold hundreds of requests that are waiting on an LLM.
+Routes without an async implementation run their blocking code on a worker
+thread (asyncio.to_thread) so they never stall the loop.
+
+Serving (from the server folder):
+    uvicorn llm_asgi:app --host 0.0.0.0 --port 5000 --workers 2
+    gunicorn llm_asgi:app -k uvicorn.workers.UvicornWorker --workers 2 --bind :8000
+
+On Elastic Beanstalk, use the gunicorn line as a Procfile entry
+("web: gunicorn llm_asgi:app ...") in place of the WSGIPath setting.
+
+Concurrency settings (config.env):
+    --workers                   one per CPU core is enough; each worker is a single event loop
+    LLM_ASYNC_MAX_CONCURRENCY   requests allowed to wait on an LLM at once per worker (default 256)
+    ASYNC_THREAD_POOL_SIZE      threads for the blocking fallbacks per worker (default 32)
+    MONGODB_MAX_POOL_SIZE       connections per client; each worker has a sync and an async client
+"""
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from dotenv import load_dotenv
+from quart import Quart, request, jsonify, Blueprint, Response
+from llm_component import api, review_summariser, ItineraryProcessor, ItineraryAiProcessor, catalog, database, itinerary_jobs, itinerary_renderer
+
+ROOT_DIR = Path(__file__).resolve().parent
+load_dotenv(dotenv_path=str(ROOT_DIR / "config.env"))
+
+LLM_ASYNC_MAX_CONCURRENCY = int(os.getenv("LLM_ASYNC_MAX_CONCURRENCY", "256"))
+ASYNC_THREAD_POOL_SIZE = int(os.getenv("ASYNC_THREAD_POOL_SIZE", "32"))
+
+app = Quart(__name__)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+app.logger.setLevel(logging.INFO)
+
+llm_slots = None
+
+
+@app.before_serving
+async def startup():
+    global llm_slots
+
+    llm_slots = asyncio.Semaphore(LLM_ASYNC_MAX_CONCURRENCY)
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=ASYNC_THREAD_POOL_SIZE, thread_name_prefix="asgi-blocking"))
+
+    # The first catalog load and the index setup are blocking MongoDB calls
+    await asyncio.to_thread(catalog.start_catalog_refresher)
+    await asyncio.to_thread(api.prepare_process)
+
+@app.after_serving
+async def shutdown():
+    api.shutdown_process()
+    await database.close_async_db_client()
+
+
+async def iterate_in_thread(iterator):
+    """Drive a blocking iterator on a worker thread, yielding its items on the event loop."""
+    iterator = iter(iterator)
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+def error_response(e, route):
+    body, status, headers = api.error_response(e, route)
+    return jsonify(body), status, headers
+
+def sse_response(events, route):
+    return Response(iterate_in_thread(api.sse_stream(events, route)), mimetype=api.SSE_MIMETYPE, headers=api.SSE_HEADERS)
+
+async def run_render(render, *args):
+    # Wait on the render pool without holding the event loop
+    return await asyncio.wrap_future(itinerary_renderer.get_render_executor().submit(render, *args))
+
+
+llm_bp = Blueprint('llm', __name__, url_prefix=api.URL_PREFIX)
+
+@llm_bp.route('/summary/')
+async def home():
+    return jsonify(api.home_body())
+
+@llm_bp.route('/summary/businessSummary')
+async def businessSummary():
+    try:
+        business_id = api.required_arg(request.args, 'businessId')
+        async with llm_slots:
+            summary = await review_summariser.arun_summariser_business(business_id)
+        return jsonify({'summary': summary})
+
+    except Exception as e:
+        return error_response(e, '/businessSummary')
+
+@llm_bp.route('/summary/locationSummary')
+async def locationSummary():
+    try:
+        location_id = api.required_arg(request.args, 'locationId')
+        async with llm_slots:
+            summary = await review_summariser.arun_summariser_location(location_id)
+        return jsonify({'summary': summary})
+
+    except Exception as e:
+        return error_response(e, '/locationSummary')
+
+@llm_bp.route('/summary/businessSummary/stream')
+async def businessSummaryStream():
+    try:
+        business_id = api.required_arg(request.args, 'businessId')
+    except Exception as e:
+        return error_response(e, '/businessSummary/stream')
+
+    return sse_response(api.summary_chunks(review_summariser.stream_summariser_business(business_id)), '/businessSummary')
+
+@llm_bp.route('/summary/locationSummary/stream')
+async def locationSummaryStream():
+    try:
+        location_id = api.required_arg(request.args, 'locationId')
+    except Exception as e:
+        return error_response(e, '/locationSummary/stream')
+
+    return sse_response(api.summary_chunks(review_summariser.stream_summariser_location(location_id)), '/locationSummary')
+
+@llm_bp.route('/summary/batch', methods=['POST'])
+async def batchSummary():
+    try:
+        body = await request.get_json(silent=True) or {}
+        entity_ids = api.batch_entity_ids(body)
+
+        if body.get('stream'):
+            lines = api.batch_lines(review_summariser.iter_summariser_batch(entity_ids))
+            return Response(iterate_in_thread(lines), mimetype=api.NDJSON_MIMETYPE)
+
+        summaries, errors = await asyncio.to_thread(review_summariser.run_summariser_batch, entity_ids)
+        return jsonify({'summaries': summaries, 'errors': errors})
+
+    except Exception as e:
+        return error_response(e, '/summary/batch')
+
+@llm_bp.route('/itinerary/process', methods=['POST'])
+async def process_itinerary():
+    try:
+        itinerary_data = api.required_body(await request.get_json(silent=True), 'Itinerary data is required')
+        optimization = itinerary_data.get('optimization')
+        itinerary_requirements = await asyncio.to_thread(ItineraryProcessor.run, itinerary_data, optimization)
+        return jsonify({'i_reqs': itinerary_requirements}), 200
+
+    except Exception as e:
+        return error_response(e, '/itinerary/process')
+
+@llm_bp.route('/itinerary/processAiItinerary', methods=['POST'])
+async def process_AI_itinerary():
+    try:
+        query = api.required_body(await request.get_json(silent=True), 'query is required')
+        async with llm_slots:
+            generated_itinerary = await ItineraryAiProcessor.arun(query)
+        return jsonify({'generated_itinerary': generated_itinerary}), 200
+
+    except Exception as e:
+        return error_response(e, '/itinerary/processAiItinerary')
+
+@llm_bp.route('/itinerary/processAiItinerary/stream', methods=['POST'])
+async def process_AI_itinerary_stream():
+    try:
+        query = api.required_body(await request.get_json(silent=True), 'query is required')
+    except Exception as e:
+        return error_response(e, '/itinerary/processAiItinerary/stream')
+
+    return sse_response(ItineraryAiProcessor.run_stream(query), '/processAiItinerary')
+
+@llm_bp.route('/itinerary/jobs', methods=['POST'])
+async def create_AI_itinerary_job():
+    try:
+        query = api.required_body(await request.get_json(silent=True), 'query is required')
+        job = await asyncio.to_thread(itinerary_jobs.get_job_manager().submit, query)
+        body, status, headers = api.job_created(job)
+        return jsonify(body), status, headers
+
+    except Exception as e:
+        return error_response(e, '/itinerary/jobs')
+
+@llm_bp.route('/itinerary/jobs/<job_id>', methods=['GET'])
+async def get_AI_itinerary_job(job_id):
+    try:
+        job = await asyncio.to_thread(itinerary_jobs.get_job_manager().get, job_id)
+        return jsonify(api.job_body(job)), 200
+
+    except Exception as e:
+        return error_response(e, f'/itinerary/jobs/{job_id}')
+
+@llm_bp.route('/itinerary/render', methods=['POST'])
+async def render_itinerary():
+    try:
+        itinerary, template_id = api.render_request(await request.get_json(silent=True) or {}, 'itinerary')
+        image = await run_render(itinerary_renderer.render_basic_itinerary, itinerary, template_id)
+        return Response(image, mimetype='image/png')
+
+    except Exception as e:
+        return error_response(e, '/itinerary/render')
+
+@llm_bp.route('/itinerary/renderAiItinerary', methods=['POST'])
+async def render_AI_itinerary():
+    try:
+        query, template_id = api.render_request(await request.get_json(silent=True) or {}, 'query')
+        async with llm_slots:
+            image = await run_render(itinerary_renderer.render_ai_itinerary, query, template_id)
+        return Response(image, mimetype='image/png')
+
+    except Exception as e:
+        return error_response(e, '/itinerary/renderAiItinerary')
+
+@llm_bp.route('/metrics')
+async def metrics():
+    return jsonify(api.metrics())
+
+app.register_blueprint(llm_bp)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run("llm_asgi:app", host='0.0.0.0', port=5000)
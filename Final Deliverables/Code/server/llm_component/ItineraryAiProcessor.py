@@ -1,43 +1,55 @@
 import os
 import re
 import json
-import pymongo
-from openai import AzureOpenAI
-from geopy.distance import geodesic
+import numpy as np
+import asyncio
+import logging
 from dotenv import load_dotenv
+from llm_component import catalog, database, geo, geo_queries, llm_clients, prompt_encoding, query_cache, query_parser
 
 # Load environment variables
 load_dotenv(dotenv_path="../config.env")
 
 STOP_CATEGORIES = ["hotel", "restaurant", "entertainment", "services"]
+OPTIMIZATION_TYPES = ["rating", "cost", "distance"]
+
+# "single" extracts everything in one structured o3-mini call, "two_step" uses the original pair of calls
+AI_ITINERARY_EXTRACTION = os.getenv("AI_ITINERARY_EXTRACTION", "single").lower()
+
+logger = logging.getLogger(__name__)
+
+# Structured output schema for the single-call extraction; coordinates are looked up locally, not generated
+QUERY_EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "optimization": {"type": "string", "enum": OPTIMIZATION_TYPES},
+        "locations": {"type": "array", "items": {"type": "string"}},
+        "number_of_stops": {"type": "integer"},
+        "stops": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"category": {"type": "string", "enum": STOP_CATEGORIES}},
+                "required": ["category"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["optimization", "locations", "number_of_stops", "stops"],
+    "additionalProperties": False
+}
 
 def create_llm_client():
-    """Create an Azure OpenAI client."""
-    return AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version="2025-03-01-preview",
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
+    """Return the shared Azure OpenAI client."""
+    return llm_clients.get_azure_client()
+
+def create_async_llm_client():
+    """Return the shared async Azure OpenAI client, for llm_asgi.py."""
+    return llm_clients.get_async_azure_client()
 
 def connect_to_db():
-    """Connect to MongoDB database."""
-    return pymongo.MongoClient(os.getenv("MONGODB_URI_REMOTE"))
-
-def extract_locations_data(db):
-    """Extract location data from the database."""
-    collection = db["Location"]
-    locations_data = {doc["name"]: doc["coordinates"]["coordinates"] for doc in collection.find()}
-    locations_data = {f"[{index}]": value for index, value in locations_data.items()}
-    return locations_data
-
-def extract_business_data(db):
-    """Extract business data from the database."""
-    collection = db["Business"]
-    business_data = {doc["name"]: [doc["address"], doc["category"], 
-                                  doc["coordinates"]["coordinates"], doc["averageRating"]] 
-                     for doc in collection.find()}
-    business_data = {f"[{index}]": value for index, value in business_data.items()}
-    return business_data
+    """Return the shared MongoDB client."""
+    return database.get_db_client()
 
 def extract_business_category_metadata(db):
     """Extract unique business categories from the database."""
@@ -52,53 +64,76 @@ def clean_json_response(response):
     """Clean JSON responses from the LLM."""
     return re.sub(r"```json\n(.*?)\n```", r"\1", response, flags=re.DOTALL).strip()
 
-def predict_user_locations_and_optimization(locations_data, query, llm_client, optimization_type="rating"):
-    """Use LLM to predict locations and optimization preferences from query."""
-    valid_optimization_types = ["rating", "cost", "distance"]
+def location_prediction_messages(locations_data, query, optimization_type="rating"):
+    """Chat messages asking the LLM for the destinations and optimization in a query, and the location table to decode the answer."""
+    locations_table = prompt_encoding.encode_locations(locations_data)
 
     system_prompt = f"""
     You are an expert in data extraction and natural language processing. Your task is to figure out the most likely destinations for the user based on their query and the provided list of locations.
     The user wants to prioritize destinations based on {optimization_type}.
 
     Input Data:
-    - List of locations: {json.dumps(locations_data, indent=2, ensure_ascii=False)}
+    - List of locations:
+{locations_table.text}
     - User query: "{query}"
-    - Optimization Types: {valid_optimization_types}
+    - Optimization Types: {OPTIMIZATION_TYPES}
 
     Instructions:
     - Analyze the query to determine which locations from the list are most relevant to the user's request.
-    - Return a list of the most likely destinations based on the query
+    - Return the ids of the most likely destinations based on the query, starting point first.
     - Return the optimization type. If you cannot figure it out, default to "rating".
-    - The response should be a dictionary with the optimization type as key, and a dictionary of location names with coordinates as value.
 
     Output Format (Strict):
-    {{  
-        "optimization": "optimization_type"
-        "locations": {{
-            "Location Name 1": [Latitude1, Longitude1],
-            "Location Name 2": [Latitude2, Longitude2],
-            ...
-        }}
-    }}
+    {{"optimization": "optimization_type", "locations": ["L1", "L2"]}}
     """
 
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query if isinstance(query, str) else prompt_encoding.compact_json(query)}
+    ]
+    return messages, locations_table
+
+def decode_location_predictions(content, locations_data, locations_table):
+    """Replace the location ids in the LLM's answer with catalog names and coordinates."""
+    predictions = json.loads(clean_json_response(content))
+    location_predictions = {}
+    # A dict answer means the model used names as keys, as the old prompt asked
+    for value in list(predictions.get("locations") or []):
+        key = locations_table.decode(value)
+        if key is not None:
+            location_predictions[key] = locations_data[key]
+    predictions["locations"] = location_predictions
+    return json.dumps(predictions, ensure_ascii=False)
+
+def predict_user_locations_and_optimization(locations_data, query, llm_client, optimization_type="rating"):
+    """Use LLM to predict locations and optimization preferences from query."""
+    messages, locations_table = location_prediction_messages(locations_data, query, optimization_type)
     response = llm_client.chat.completions.create(
         model="o3-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query}
-        ]
+        messages=messages
     )
+    prompt_encoding.report_prompt("location_prediction", messages, response)
 
-    return clean_json_response(response.choices[0].message.content)
+    return decode_location_predictions(response.choices[0].message.content, locations_data, locations_table)
 
-def predict_stops_and_categories(location_predictions, query, llm_client):
-    """Use LLM to predict stop categories and count from query."""
+async def apredict_user_locations_and_optimization(locations_data, query, llm_client, optimization_type="rating"):
+    """predict_user_locations_and_optimization on the async client."""
+    messages, locations_table = location_prediction_messages(locations_data, query, optimization_type)
+    response = await llm_client.chat.completions.create(
+        model="o3-mini",
+        messages=messages
+    )
+    prompt_encoding.report_prompt("location_prediction", messages, response)
+
+    return decode_location_predictions(response.choices[0].message.content, locations_data, locations_table)
+
+def stop_prediction_messages(location_predictions, query):
+    """Chat messages asking the LLM for the number and categories of stops in a query."""
     system_prompt = f"""
     You are a travel assistant. Your task is to extract the number of stops, specific stops (locations), and the types of stops based on the provided query and the list of location predictions.
 
     Input Data:
-    - List of predicted locations: {json.dumps(location_predictions, indent=2, ensure_ascii=False)}
+    - List of predicted locations: {", ".join(prompt_encoding.display_name(name) for name in location_predictions)}
     - User query: "{query}"
 
     Instructions:
@@ -127,15 +162,113 @@ def predict_stops_and_categories(location_predictions, query, llm_client):
     3. The category or type of each stop (e.g., hotel, restaurant, entertainment, services).
     """
 
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def predict_stops_and_categories(location_predictions, query, llm_client):
+    """Use LLM to predict stop categories and count from query."""
+    messages = stop_prediction_messages(location_predictions, query)
     response = llm_client.chat.completions.create(
         model="o3-mini", 
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        messages=messages
+    )
+    prompt_encoding.report_prompt("stop_prediction", messages, response)
+    return clean_json_response(response.choices[0].message.content)
+
+async def apredict_stops_and_categories(location_predictions, query, llm_client):
+    """predict_stops_and_categories on the async client."""
+    messages = stop_prediction_messages(location_predictions, query)
+    response = await llm_client.chat.completions.create(
+        model="o3-mini",
+        messages=messages
     )
+    prompt_encoding.report_prompt("stop_prediction", messages, response)
     return clean_json_response(response.choices[0].message.content)
 
+def query_extraction_messages(locations_data, query):
+    """Chat messages asking the LLM for destinations, optimization and stops in one answer, and the location table to decode it."""
+    locations_table = prompt_encoding.encode_locations(locations_data)
+    system_prompt = f"""
+    You are a travel assistant and an expert in data extraction. From the user's query and the list of known locations, extract everything needed to plan their trip.
+
+    Input Data:
+    - Known locations:
+{locations_table.text}
+    - User query: "{query}"
+
+    Instructions:
+    - locations: ids of the known locations the trip goes through, starting point first, then the destination.
+    - optimization: what the user wants to prioritise, one of {OPTIMIZATION_TYPES}. If you cannot figure it out, use "rating".
+    - number_of_stops: how many stops the user intends to make along the way.
+    - stops: one entry per stop with its category, one of {STOP_CATEGORIES}.
+    """
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query if isinstance(query, str) else prompt_encoding.compact_json(query)}
+    ]
+    return messages, locations_table
+
+def _query_extraction_request(messages):
+    return dict(
+        model="o3-mini",
+        messages=messages,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "itinerary_query", "strict": True, "schema": QUERY_EXTRACTION_SCHEMA}
+        }
+    )
+
+def validate_query_extraction(extraction, locations_data, locations_table):
+    """Turn a single-call answer into (optimization, location_predictions, stop_predictions). Raises ValueError if it does not hold up."""
+    if isinstance(extraction, str):
+        extraction = json.loads(clean_json_response(extraction))
+
+    optimization = extraction.get("optimization")
+    if optimization not in OPTIMIZATION_TYPES:
+        raise ValueError(f"unknown optimization {optimization!r}")
+
+    location_predictions = {}
+    for value in extraction.get("locations") or []:
+        key = locations_table.decode(value)
+        if key is None:
+            raise ValueError(f"unknown location {value!r}")
+        location_predictions[key] = locations_data[key]
+    if not location_predictions:
+        raise ValueError("no locations extracted")
+
+    stops = extraction.get("stops") or []
+    if not stops or any(stop.get("category") not in STOP_CATEGORIES for stop in stops):
+        raise ValueError(f"invalid stops {stops!r}")
+
+    stop_predictions = {"number_of_stops": len(stops), "stops": [{"category": stop["category"]} for stop in stops]}
+    return optimization, location_predictions, stop_predictions
+
+def extract_query(locations_data, query, llm_client):
+    """One o3-mini round trip for locations, optimization and stops. Raises on any invalid answer."""
+    messages, locations_table = query_extraction_messages(locations_data, query)
+    response = llm_client.chat.completions.create(**_query_extraction_request(messages))
+    prompt_encoding.report_prompt("query_extraction", messages, response)
+    return validate_query_extraction(response.choices[0].message.content, locations_data, locations_table)
+
+async def aextract_query(locations_data, query, llm_client):
+    """extract_query on the async client."""
+    messages, locations_table = query_extraction_messages(locations_data, query)
+    response = await llm_client.chat.completions.create(**_query_extraction_request(messages))
+    prompt_encoding.report_prompt("query_extraction", messages, response)
+    return validate_query_extraction(response.choices[0].message.content, locations_data, locations_table)
+
+def use_single_call_extraction():
+    return AI_ITINERARY_EXTRACTION == "single"
+
+def is_cacheable_extraction(extracted):
+    """Only extractions an itinerary can be built from go into the query cache."""
+    _, location_predictions, stop_predictions = extracted
+    stops = (stop_predictions or {}).get("stops") or []
+    return bool(location_predictions) and all(stop.get("category") in STOP_CATEGORIES for stop in stops)
+
 def get_top_businesses_by_category(business_data, optimization_criteria='rating', top_n=5):
     """Generate a dictionary of top businesses by category."""
     categorized_businesses = {}
@@ -168,6 +301,23 @@ def get_top_businesses_by_category(business_data, optimization_criteria='rating'
     
     return top_businesses
 
+def get_top_businesses_along_route(location_predictions, stop_predictions, top_n=5):
+    """Top businesses per requested category inside the route corridor, fetched with $geoNear."""
+    route_coords = list(location_predictions.values())
+    start_coords = route_coords[0]
+    end_coords = route_coords[1] if len(route_coords) > 1 else None
+
+    top_businesses = {}
+    for stop in stop_predictions.get("stops", []):
+        category = stop["category"].capitalize()
+        if category in top_businesses:
+            continue
+        if end_coords:
+            top_businesses[category] = geo_queries.find_businesses_along_route(start_coords, end_coords, category, limit=top_n)
+        else:
+            top_businesses[category] = geo_queries.find_businesses_near(start_coords, category, sort_by="rating", limit=top_n)
+    return top_businesses
+
 def generate_itinerary(optimization, location_predictions, stop_predictions, top_businesses):
     """Generate a formatted itinerary avoiding duplicate locations."""
     # Parse stop_predictions if it's a string
@@ -189,11 +339,11 @@ def generate_itinerary(optimization, location_predictions, stop_predictions, top
     start_coords = location_predictions[route_locations[0]]
     end_coords = location_predictions[route_locations[1]] if len(route_locations) > 1 else None
     
-    # Calculate midpoint
+    # Calculate midpoint ([longitude, latitude], same order as the catalog coordinates)
     if end_coords:
-        midpoint = [(start_coords[1] + end_coords[1])/2, (start_coords[0] + end_coords[0])/2]
+        midpoint = [(start_coords[0] + end_coords[0])/2, (start_coords[1] + end_coords[1])/2]
     else:
-        midpoint = [start_coords[1], start_coords[0]] 
+        midpoint = [start_coords[0], start_coords[1]]
     
     # Select stops avoiding duplicates
     selected_stops = []
@@ -205,19 +355,21 @@ def generate_itinerary(optimization, location_predictions, stop_predictions, top
         if category in top_businesses:
             scored_candidates = []
             
-            for business in top_businesses[category]:
+            # Distances from the midpoint to every candidate in one vectorized call
+            candidates = top_businesses[category]
+            distances = geo.haversine_km(midpoint, [business['coordinates'] for business in candidates])
+            
+            for business, distance in zip(candidates, distances):
                 # Skip if already used
                 location_key = f"{business['coordinates'][0]},{business['coordinates'][1]}"
                 if location_key in used_locations:
                     continue
                 
                 # Calculate distance score
-                business_coords = [business['coordinates'][1], business['coordinates'][0]]
-                try:
-                    distance = geodesic(midpoint, business_coords).km
-                    normalized_distance = distance / 100 if distance > 0 else 0
-                except:
+                if np.isnan(distance):
                     normalized_distance = 10
+                else:
+                    normalized_distance = distance / 100 if distance > 0 else 0
                 
                 # Combined score (rating - distance penalty)
                 score = business['rating'] - normalized_distance
@@ -238,12 +390,7 @@ def generate_itinerary(optimization, location_predictions, stop_predictions, top
     # Calculate total route distance
     total_distance = None
     if end_coords:
-        try:
-            start_geopy = [start_coords[1], start_coords[0]]
-            end_geopy = [end_coords[1], end_coords[0]]
-            total_distance = geodesic(start_geopy, end_geopy).km
-        except:
-            pass
+        total_distance = geo.distance_km(start_coords, end_coords)
     
     # Build itinerary text
     itinerary = f"✨ Journey from {start_location} to {end_location} ✨\n\n"
@@ -258,16 +405,14 @@ def generate_itinerary(optimization, location_predictions, stop_predictions, top
     if selected_stops:
         itinerary += "📍 Recommended Stops:\n"
         
-        for i, stop in enumerate(selected_stops, 1):
-            # Calculate distance from start
-            stop_coords = [stop['coordinates'][1], stop['coordinates'][0]]
-            start_geopy = [start_coords[1], start_coords[0]]
-            
-            try:
-                distance_from_start = geodesic(start_geopy, stop_coords).km
-                distance_text = f"(~{round(distance_from_start, 1)} km from start)"
-            except:
+        # Distance from start for every stop at once
+        distances_from_start = geo.haversine_km(start_coords, [stop['coordinates'] for stop in selected_stops])
+        
+        for i, (stop, distance_from_start) in enumerate(zip(selected_stops, distances_from_start), 1):
+            if np.isnan(distance_from_start):
                 distance_text = ""
+            else:
+                distance_text = f"(~{round(float(distance_from_start), 1)} km from start)"
             
             # Format stop details
             itinerary += f"  {i}. {stop['name']} ({stop['category']}) {distance_text}\n"
@@ -280,32 +425,101 @@ def generate_itinerary(optimization, location_predictions, stop_predictions, top
     
     return itinerary
 
-def run(query):
-    """Main function to generate an itinerary from a user query."""
+def run_stream(query, query_mode=None):
+    """Generate an itinerary, yielding (stage, data) events as each step of the pipeline finishes."""
     # Connect to resources
-    db_client = connect_to_db()
-    db = db_client["OdysseumDatabase"]
     llm_client = create_llm_client()
 
-    # Extract data
-    locations_data = extract_locations_data(db)
-    business_data = extract_business_data(db)
+    # Read data from the shared catalog snapshot
+    snapshot = catalog.get_catalog()
+    locations_data = snapshot.locations_data
+    business_data = snapshot.business_data
 
-    # Generate predictions
-    predictions = predict_user_locations_and_optimization(locations_data, query, llm_client)
-    predictions = json.loads(predictions)
-    optimization = predictions["optimization"]
-    location_predictions = predictions["locations"]  
+    # Simple queries are parsed locally and repeated ones come from the cache; only the rest reach the LLM
+    extracted = query_parser.try_fast_path(query, snapshot)
+    if extracted is None:
+        extracted = query_cache.get_extraction(query, snapshot)
+    # Set when the LLM produced the extraction; cached only once the itinerary has been built from it
+    llm_extracted = None
+    if extracted is None and use_single_call_extraction():
+        try:
+            extracted = llm_extracted = extract_query(locations_data, query, llm_client)
+        except Exception as e:
+            logger.warning(f"Single-call query extraction failed, using two-step extraction: {str(e)}")
+
+    if extracted is not None:
+        optimization, location_predictions, stop_predictions = extracted
+        yield "locations", {"optimization": optimization, "locations": location_predictions}
+        yield "stops", stop_predictions
+    else:
+        # Generate predictions
+        predictions = predict_user_locations_and_optimization(locations_data, query, llm_client)
+        predictions = json.loads(predictions)
+        optimization = predictions["optimization"]
+        location_predictions = predictions["locations"]
+        yield "locations", {"optimization": optimization, "locations": location_predictions}
 
-    # Predict stops and categories
-    stop_predictions = predict_stops_and_categories(location_predictions, query, llm_client)
-    stop_predictions = json.loads(stop_predictions)
+        # Predict stops and categories
+        stop_predictions = predict_stops_and_categories(location_predictions, query, llm_client)
+        stop_predictions = json.loads(stop_predictions)
+        llm_extracted = (optimization, location_predictions, stop_predictions)
+        yield "stops", stop_predictions
 
     # Get business data and generate itinerary
-    top_businesses = get_top_businesses_by_category(business_data, optimization)
+    if geo_queries.use_geo_queries(query_mode):
+        top_businesses = get_top_businesses_along_route(location_predictions, stop_predictions)
+    else:
+        top_businesses = get_top_businesses_by_category(business_data, optimization)
     generated_itinerary = generate_itinerary(optimization, location_predictions, stop_predictions, top_businesses)
+    if llm_extracted is not None and is_cacheable_extraction(llm_extracted):
+        query_cache.put_extraction(query, snapshot, llm_extracted)
+
+    # The itinerary text is built locally; send it a section at a time, then whole
+    sections = generated_itinerary.split("\n\n")
+    for i, section in enumerate(sections):
+        yield "itinerary_chunk", section if i == len(sections) - 1 else section + "\n\n"
+    yield "itinerary", generated_itinerary
 
-    # Close database connection
-    db_client.close()
+def run(query, query_mode=None):
+    """Main function to generate an itinerary from a user query."""
+    for stage, data in run_stream(query, query_mode):
+        if stage == "itinerary":
+            return data
+
+async def arun(query, query_mode=None):
+    """run() for the async server: the LLM calls are awaited instead of holding a thread."""
+    llm_client = create_async_llm_client()
+
+    # Only the first call in a process loads the catalog from MongoDB
+    snapshot = await asyncio.to_thread(catalog.get_catalog)
+
+    extracted = query_parser.try_fast_path(query, snapshot)
+    if extracted is None:
+        extracted = await query_cache.aget_extraction(query, snapshot)
+    llm_extracted = None
+    if extracted is None and use_single_call_extraction():
+        try:
+            extracted = llm_extracted = await aextract_query(snapshot.locations_data, query, llm_client)
+        except Exception as e:
+            logger.warning(f"Single-call query extraction failed, using two-step extraction: {str(e)}")
 
-    return generated_itinerary
\ No newline at end of file
+    if extracted is not None:
+        optimization, location_predictions, stop_predictions = extracted
+    else:
+        predictions = await apredict_user_locations_and_optimization(snapshot.locations_data, query, llm_client)
+        predictions = json.loads(predictions)
+        optimization = predictions["optimization"]
+        location_predictions = predictions["locations"]
+
+        stop_predictions = await apredict_stops_and_categories(location_predictions, query, llm_client)
+        stop_predictions = json.loads(stop_predictions)
+        llm_extracted = (optimization, location_predictions, stop_predictions)
+
+    if geo_queries.use_geo_queries(query_mode):
+        top_businesses = await asyncio.to_thread(get_top_businesses_along_route, location_predictions, stop_predictions)
+    else:
+        top_businesses = get_top_businesses_by_category(snapshot.business_data, optimization)
+    generated_itinerary = generate_itinerary(optimization, location_predictions, stop_predictions, top_businesses)
+    if llm_extracted is not None and is_cacheable_extraction(llm_extracted):
+        await query_cache.aput_extraction(query, snapshot, llm_extracted)
+    return generated_itinerary
@@ -1,34 +1,15 @@
-import pymongo
 from dotenv import load_dotenv
-import os
-from openai import AzureOpenAI
+from llm_component import catalog, database, llm_clients, geo, geo_queries, spatial_index, recommendation_index
 
 load_dotenv(dotenv_path="../config.env")
 
 CATEGORIES = ['restaurant', 'entertainment', 'services', 'hotel', 'other']
 
 def create_llm_client():
-    return AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version="2025-03-01-preview",
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
+    return llm_clients.get_azure_client()
 
 def connect_to_db():
-    db_client = pymongo.MongoClient(os.getenv("MONGODB_URI_REMOTE"))
-    return db_client
-
-def extract_locations_data(db):
-    collection = db["Location"]
-    locations_data = {doc["name"]: doc["coordinates"]["coordinates"] for doc in collection.find()}
-    locations_data = {f"[{index}]": value for index, value in locations_data.items()}
-    return locations_data
-
-def extract_business_data(db):
-    collection = db["Business"]
-    business_data = {doc["name"]: [doc["address"], doc["category"], doc["coordinates"]["coordinates"], doc["averageRating"]] for doc in collection.find()}
-    business_data = {f"[{index}]": value for index, value in business_data.items()}
-    return business_data
+    return database.get_db_client()
 
 def extract_business_category_metadata(db):
     collection = db["Business"]
@@ -38,28 +19,27 @@ def extract_business_category_metadata(db):
             business_metadata.append(doc["category"])
     return business_metadata
 
-def generate_business_location_data_algorithm(locations_data, business_data):
+def generate_business_location_data_algorithm(locations_data, business_data, location_index=None):
     # Initialize result dictionary with empty lists for each location
     result = {location_name.strip("[]"): [] for location_name in locations_data.keys()}
     
-    # Convert location coordinates to a more accessible format
-    location_coords = {}
-    for loc_name, coords in locations_data.items():
-        clean_name = loc_name.strip("[]")
-        location_coords[clean_name] = coords
+    # Spatial index over location coordinates, normally built once per catalog version
+    if location_index is None:
+        location_index = spatial_index.LocationGridIndex(locations_data)
+    
+    business_coords_list = [business_value[2] if len(business_value) > 2 else None for business_value in business_data.values()]
+    closest_locations = location_index.nearest_many(business_coords_list)
     
     # Process each business
-    for business_key, business_value in business_data.items():
+    for (business_key, business_value), closest_location in zip(business_data.items(), closest_locations):
         business_name = business_key.strip("[]")
         business_address = business_value[0] if len(business_value) > 0 else ""
         business_category = business_value[1] if len(business_value) > 1 else ""
         business_coords = business_value[2] if len(business_value) > 2 else None
         business_rating = business_value[3] if len(business_value) > 3 else "N/A"
         
-        # Find the closest location based on coordinates if available
+        # Closest location based on coordinates if available
         if business_coords:
-            closest_location = find_closest_location(business_coords, location_coords)
-            
             # Add business to the matched location
             if closest_location:
                 result[closest_location].append({
@@ -100,9 +80,9 @@ def calculate_distance(coords1, coords2):
     except (TypeError, IndexError):
         return float('inf')
     
-def generate_optimized_business_data(locations_data, business_data, optimization, top_n=5):
+def generate_optimized_business_data(locations_data, business_data, optimization, top_n=5, location_index=None):
     # First, grouping all businesses by location
-    all_businesses_by_location = generate_business_location_data_algorithm(locations_data, business_data)
+    all_businesses_by_location = generate_business_location_data_algorithm(locations_data, business_data, location_index)
     result = {}
     
     # For each location, filter the top N businesses based on optimization criteria
@@ -123,7 +103,8 @@ def generate_optimized_business_data(locations_data, business_data, optimization
 
             elif optimization.lower() == 'distance':
                 central_point = find_central_point(location, locations_data)
-                sorted_businesses = sorted(filtered, key=lambda x: calculate_distance(x.get('coordinates'), central_point))
+                ranking = geo.rank_by_distance(central_point, [x.get('coordinates') for x in filtered])
+                sorted_businesses = [filtered[i] for i in ranking]
             
             else:
                 sorted_businesses = sorted(filtered, key=lambda x: float(x.get('rating', 0) or 0), reverse=True)
@@ -138,7 +119,7 @@ def find_central_point(location_name, locations_data):
             return coords
     return [0, 0]  
 
-def get_itinerary_recommendations(itinerary, optimized_data):
+def get_itinerary_recommendations(itinerary, rec_index, optimization, top_n=5):
     result = {}
     for dst in itinerary.get('destinations', ''):
         location = dst.get('name')
@@ -147,16 +128,35 @@ def get_itinerary_recommendations(itinerary, optimized_data):
         stops = dst.get('stops')
         for stop in stops:
             stop_category = stop.get('category')
-            top_n_stops = optimized_data[location][stop_category]
+            top_n_stops = rec_index.top(location, stop_category, optimization, top_n)
             result[location][stop_category] = top_n_stops
     return result
 
-def run(itinerary, optimization):
-    db_client = connect_to_db()
-    db = db_client["OdysseumDatabase"]
+def get_itinerary_recommendations_geo(itinerary, locations_data, optimization, top_n=5):
+    """Same result shape as get_itinerary_recommendations, with the filtering done by MongoDB $geoNear."""
+    sort_by = 'distance' if str(optimization or '').lower() == 'distance' else 'rating'
+    result = {}
+    for dst in itinerary.get('destinations', ''):
+        location = dst.get('name')
+        result[location] = {}
+        # find_central_point falls back to [0, 0]; an unknown destination is an error, as in catalog mode
+        central_point = next((coords for loc_name, coords in locations_data.items() if loc_name.strip("[]") == location and coords), None)
+        if central_point is None:
+            raise KeyError(location)
+
+        stops = dst.get('stops')
+        for stop in stops:
+            stop_category = stop.get('category')
+            result[location][stop_category] = geo_queries.find_businesses_near(central_point, stop_category, sort_by=sort_by, limit=top_n)
+    return result
+
+def run(itinerary, optimization, query_mode=None):
+    snapshot = catalog.get_catalog()
+
+    if geo_queries.use_geo_queries(query_mode):
+        return get_itinerary_recommendations_geo(itinerary, snapshot.locations_data, optimization)
 
-    locations_data = extract_locations_data(db)
-    business_data = extract_business_data(db)
-    optimized_data = generate_optimized_business_data(locations_data, business_data, optimization)
-    itinerary_recommendations = get_itinerary_recommendations(itinerary, optimized_data)
+    location_index = spatial_index.get_location_index(snapshot)
+    rec_index = recommendation_index.get_recommendation_index(snapshot, location_index)
+    itinerary_recommendations = get_itinerary_recommendations(itinerary, rec_index, optimization)
     return itinerary_recommendations
\ No newline at end of file
@@ -2,26 +2,33 @@ import pymongo
 from langchain_groq import ChatGroq
 from langchain.schema import SystemMessage, HumanMessage
 from dotenv import load_dotenv
-from PIL import Image, ImageDraw, ImageFont
-import random
+import itertools
+import logging
 import json
 import re
 import os
 import sys
 
+if __package__ in (None, ""):
+    # Run as a script by the Node controllers: make the llm_component package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_component import candidate_retrieval, catalog, prompt_encoding, render_assets, spatial_index
+
 load_dotenv()
 
+# Group businesses with the LLM instead of the coordinate / locationId join
+AI_ITINERARY_LLM_GROUPING = os.getenv("AI_ITINERARY_LLM_GROUPING", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
 def connect_to_db():
     db_client = pymongo.MongoClient(os.getenv("MONGODB_URI_REMOTE"))
     return db_client
 
 
-def extract_locations_data(db):
-    collection = db["Location"]
-    locations_data = {doc["name"]: doc["coordinates"]["coordinates"] for doc in collection.find()}
-    locations_data = {f"[{index}]": value for index, value in locations_data.items()}
-    return locations_data
-
+def extract_location_keys(db):
+    """Location _id -> locations_data key, for resolving Business.locationId."""
+    return {doc["_id"]: f"[{doc['name']}]" for doc in db["Location"].find({}, {"name": 1})}
 
 def extract_business_category_metadata(db):
     collection = db["Business"]
@@ -31,60 +38,71 @@ def extract_business_category_metadata(db):
             business_metadata.append(doc["category"])
     return business_metadata
 
-def extract_business_data(db):
-    collection = db["Business"]
-    business_data = {doc["name"]: [doc["address"], doc["category"], doc["coordinates"]["coordinates"], doc["averageRating"]] for doc in collection.find()}
-    business_data = {f"[{index}]": value for index, value in business_data.items()}
-    return business_data
-
 def clean_json_response(response):
     return re.sub(r"```json\n(.*?)\n```", r"\1", response, flags=re.DOTALL).strip()
 
-# Need bigger model for larger capacity
-def trim_business_data(business_data, max_tokens=5000):
-    all_businesses = [(location, business) for location, business in business_data.items()]
-    random.shuffle(all_businesses)    
 
-    estimated_tokens = 0
-    filtered_data = {}
-    for location, business in all_businesses:
-        if location not in filtered_data:
-            business_tokens =  len(json.dumps(business))
-            if estimated_tokens + business_tokens > max_tokens:
-                break
+def business_record(name, details):
+    """The business fields the route prompt and format_route work with."""
+    address, category, coordinates, rating = details[:4]
+    return {
+        "name": prompt_encoding.display_name(name),
+        "address": address,
+        "category": category,
+        "rating": rating,
+        "cooridates": coordinates
+    }
 
-            filtered_data[location] = business
-            estimated_tokens += business_tokens
+def group_businesses_by_location(locations_data, business_data, location_keys=None):
+    """Group businesses under their locations, in the same JSON shape as generate_business_location_data.
 
-    return filtered_data
+    A business goes under its locationId (set by scraping/location_id.py) when that
+    location is known, otherwise under the location nearest to its coordinates.
+    """
+    location_keys = location_keys or {}
+    location_index = spatial_index.LocationGridIndex(locations_data)
+
+    business_location_data = {prompt_encoding.display_name(key): [] for key in locations_data}
+    for business, details in business_data.items():
+        location = location_keys.get(details[4]) if len(details) > 4 else None
+        if location in locations_data:
+            location = prompt_encoding.display_name(location)
+        else:
+            location = location_index.nearest(details[2])
+        if location is not None:
+            business_location_data[location].append(business_record(business, details))
 
+    return prompt_encoding.compact_json(business_location_data)
 
 def generate_business_location_data(locations_data, business_data, llm_client):
+    """Group businesses under their locations, as a JSON string of {location name: [business records]}.
+
+    The LLM only sees ids, names, categories and coordinates and answers with ids;
+    the full records are filled in here.
+    """
+    locations_table = prompt_encoding.encode_locations(locations_data, with_coordinates=True)
+    businesses_table = prompt_encoding.encode_businesses(
+        business_data,
+        fields=("name", "category", "lon,lat"),
+        budget_tokens=prompt_encoding.PROMPT_TOKEN_BUDGET - prompt_encoding.estimate_tokens(locations_table.text)
+    )
+
     system_prompt = f"""
     You are an expert in data extraction. Your task is to group businesses under their respective cities.
 
     Input Data:
-    - List of locations: {json.dumps(locations_data, indent=2, ensure_ascii=False)}
-    - Dictionary of businesses: {json.dumps(business_data, indent=2, ensure_ascii=False)}
+    - Locations:
+{locations_table.text}
+    - Businesses:
+{businesses_table.text}
 
     Instructions:
-    - Match businesses to their corresponding location.
+    - Match each business to the location it is in or nearest to, using the names and coordinates.
     - If a location does not have any businesses, return an empty list.
 
     Output Format (Strict dictionary):
-    Respond with only a valid dictionary, structured like this:
-    {{
-        "location_name": [
-            {{
-                "name": "Business Name",
-                "address": "Business Address",
-                "category": "Business Category",
-                "rating": "Business Rating"
-                "cooridates": "Location Coordinates"
-            }},
-            ...
-        ]
-    }}
+    Respond with only a valid dictionary of location ids to business ids, like this:
+    {{"L1": ["B1", "B4"], "L2": []}}
     DO NOT return any code, STRICTLY return a DICTIONARY OBJECT
     """
 
@@ -95,19 +113,47 @@ def generate_business_location_data(locations_data, business_data, llm_client):
         HumanMessage(content=user_prompt),
     ]
 
-    response = llm_client.invoke(messages).content
-    response = clean_json_response(response)
-    return response
+    response = llm_client.invoke(messages)
+    prompt_encoding.report_prompt("business_location_grouping", messages, response)
+    grouping = json.loads(clean_json_response(response.content))
+
+    business_location_data = {}
+    for location_id, business_ids in grouping.items():
+        location = locations_table.decode(location_id)
+        if location is None:
+            logger.warning(f"Ignoring unknown location id {location_id!r} in business grouping")
+            continue
+        records = business_location_data.setdefault(prompt_encoding.display_name(location), [])
+        for business_id in business_ids or []:
+            business = businesses_table.decode(business_id)
+            if business is not None:
+                records.append(business_record(business, business_data[business]))
+
+    return prompt_encoding.compact_json(business_location_data)
 
 
 def generate_path(question, business_location_data, business_category_data, llm_client):
+    """Ask the LLM for a route through the grouped businesses, returned as the JSON string format_route reads."""
+    if isinstance(business_location_data, str):
+        business_location_data = json.loads(business_location_data)
+
+    records = {}
+    rows = []
+    # Take locations in turn, so a prompt cut short by the token budget still covers all of them
+    for stops in itertools.zip_longest(*[[(location, record) for record in businesses] for location, businesses in business_location_data.items()]):
+        for location, record in filter(None, stops):
+            records[record["name"]] = record
+            rows.append((record["name"], [location, record["name"], record["category"], record["rating"], prompt_encoding.format_coordinates(record["cooridates"])]))
+    businesses_table = prompt_encoding.encode_table(rows, ["location", "name", "category", "rating", "lon,lat"], "B")
+
     system_prompt = f"""
     You are a travel route planner AI that determines the best travel path between locations 
     based on user preferences like distance, rating, and category.
 
     Input Data:
-    - List of locations and businesses: {json.dumps(business_location_data, indent=2, ensure_ascii=False)}
-    - List of businesses categories: {json.dumps(business_category_data, indent=2, ensure_ascii=False)}
+    - Businesses by location:
+{businesses_table.text}
+    - Business categories: {prompt_encoding.compact_json(business_category_data)}
 
     Instructions:
     - Analyze the question: "{question}"
@@ -117,33 +163,8 @@ def generate_path(question, business_location_data, business_category_data, llm_
     - Each path should have a valid category.
     
     Output Format (Strict Dictionary):
-    Respond ONLY with a valid Dictionary object like this:
-    {{
-        "route": [
-            {{  
-                "location_number": 1
-                "location_name": "Next Stop"
-                "address": "Location Address"
-                "rating": "Business rating"
-                "cooridates": "Location Coordinates"
-                "category": "Business Category"
-                "from": "Previous Location"
-                "distance_km": 12.5
-            }},
-            {{
-               "location_number": 2
-                "location_name": "Next Stop"
-                "address": "Location Address"
-                "rating": "Business rating"
-                "cooridates": "Location Coordinates"
-                "category": "Business Category"
-                "from": "Previous Location"
-                "distance_km": 10.5
-            }}
-        ],
-        "total_distance_km": 21.2
-    }}
-    ```
+    Respond ONLY with a valid Dictionary object, using the business ids, like this:
+    {{"route": [{{"id": "B3", "from": "Starting Location", "distance_km": 12.5}}, {{"id": "B7", "from": "B3", "distance_km": 8.7}}], "total_distance_km": 21.2}}
     DO NOT add explanations. Only return the Dictionary.
     """
 
@@ -154,9 +175,30 @@ def generate_path(question, business_location_data, business_category_data, llm_
         HumanMessage(content=user_prompt),
     ]
 
-    response = llm_client.invoke(messages).content
-    response = clean_json_response(response)
-    return response
+    response = llm_client.invoke(messages)
+    prompt_encoding.report_prompt("route_generation", messages, response)
+    path = json.loads(clean_json_response(response.content))
+
+    route = []
+    for stop in path.get("route") or []:
+        name = businesses_table.decode(stop.get("id"))
+        if name is None:
+            logger.warning(f"Ignoring unknown business id {stop.get('id')!r} in generated route")
+            continue
+        record = records[name]
+        previous = businesses_table.decode(stop.get("from"))
+        route.append({
+            "location_number": len(route) + 1,
+            "location_name": record["name"],
+            "address": record["address"],
+            "rating": record["rating"],
+            "cooridates": record["cooridates"],
+            "category": record["category"],
+            "from": previous if previous is not None else stop.get("from"),
+            "distance_km": stop.get("distance_km")
+        })
+
+    return json.dumps({"route": route, "total_distance_km": path.get("total_distance_km")}, ensure_ascii=False)
 
 def format_route(generated_path):
     route_dict = json.loads(generated_path) 
@@ -174,24 +216,29 @@ def format_route(generated_path):
             route += f"\nTotal Distance: {value} km\n"
     return route
 
+def create_route(question, locations_data, business_data, business_category_data, llm_client, location_keys=None, location_matcher=None):
+    """Run the AI itinerary pipeline for a question and return the route text to render."""
+    # Only the businesses most relevant to the question fit in the prompt
+    business_data = candidate_retrieval.select_candidates(question, locations_data, business_data, matcher=location_matcher)
+
+    if AI_ITINERARY_LLM_GROUPING:
+        business_location_data = generate_business_location_data(locations_data, business_data, llm_client)
+    else:
+        business_location_data = group_businesses_by_location(locations_data, business_data, location_keys)
+    generated_path = generate_path(question, business_location_data, business_category_data, llm_client)
+
+    return format_route(generated_path)
+
 def overlay_text_on_template(route, template_path):
     if not os.path.exists(template_path):
         raise FileNotFoundError(f"Template image not found: {template_path}")
 
-    template = Image.open(template_path)  
-    draw = ImageDraw.Draw(template)
-    font = ImageFont.truetype("verdana.ttf", 30)
-    x, y = 50, 250
-    for line in route.split("\n"):
-        draw.text((x, y), line, fill="black", font=font)
-        y += 35
-    output_path = "user_itinerary.png"
-    template.save(output_path)
-    return output_path
+    # Saved under a hash of its content, so concurrent runs never overwrite each other's image
+    return render_assets.render_to_file(route, template_path)
 
 
 TEMPLATES = {
-    "1": "./templates\Doc1.png",
+    "1": "./templates/Doc1.png",
     "2": "./templates/Doc2.png",
     "3": "./templates/Doc3.png",
 }
@@ -202,6 +249,9 @@ if __name__ == "__main__":
     
     template_path = TEMPLATES.get(template_idx)
 
+    # stdout carries the JSON result for the Node controller; logs go to stderr
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
     # Connecting to DB
     db_client = connect_to_db()
     db = db_client["OdysseumDatabase"]
@@ -211,16 +261,11 @@ if __name__ == "__main__":
     llm_client = ChatGroq(model=model_name)
 
     # Extracting data and useful metadata
-    locations_data = extract_locations_data(db)
-    business_data = extract_business_data(db)
+    locations_data = catalog.extract_locations_data(db)
+    business_data = catalog.extract_business_data(db, include_location_id=True)
     business_category_data = extract_business_category_metadata(db)
 
-    business_data = trim_business_data(business_data)   # Comment out when we have bigger model
-
-    business_location_data = generate_business_location_data(locations_data, business_data, llm_client)
-    generated_path = generate_path(question, business_location_data, business_category_data, llm_client)
-
-    route = format_route(generated_path)
+    route = create_route(question, locations_data, business_data, business_category_data, llm_client, extract_location_keys(db))
     itineray_path = overlay_text_on_template(route, template_path)
 
     print(json.dumps({"image_path": os.path.abspath(itineray_path)}))
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""Request handling shared by llm_server.py (Flask) and llm_asgi.py (Quart).
+
+Both servers expose the same /api/llm routes. Validation, response bodies,
+status codes, Server-Sent Event framing, the error mapping and the metrics live
+here; each server only reads the request, calls or awaits the work, and turns
+the (body, status, headers) built here into its framework's response.
+"""
+import json
+import logging
+from llm_component import catalog, database, geo_queries, itinerary_jobs, itinerary_renderer, prompt_encoding, query_cache, query_parser, render_assets, render_cache, review_summariser, summary_cache
+
+logger = logging.getLogger('flask.app')
+
+URL_PREFIX = '/api/llm'
+
+SSE_MIMETYPE = 'text/event-stream'
+# no-cache, and stop nginx (Elastic Beanstalk proxy) from buffering the stream
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+class RequestError(Exception):
+    """A request the route turns down, with the status and headers to answer it with."""
+
+    def __init__(self, message, status=400, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def prepare_process():
+    """Indexes and templates a worker process needs before serving; failures are logged, not raised."""
+    # The catalog refresher reads the newest updatedAt on every tick
+    try:
+        catalog.ensure_catalog_indexes()
+    except Exception as e:
+        logger.error(f"Could not create catalog indexes: {str(e)}")
+
+    # Keeps the review watermark lookups behind the summary cache cheap
+    try:
+        summary_cache.ensure_review_indexes()
+    except Exception as e:
+        logger.error(f"Could not create review indexes: {str(e)}")
+
+    # MongoDB-side geo queries need their 2dsphere indexes
+    if geo_queries.use_geo_queries():
+        try:
+            geo_queries.ensure_geo_indexes()
+        except Exception as e:
+            logger.error(f"Could not create geo indexes: {str(e)}")
+
+    # Expired itinerary jobs are removed by a TTL index
+    if itinerary_jobs.ITINERARY_JOB_STORE == "mongo":
+        try:
+            itinerary_jobs.MongoJobStore().ensure_indexes()
+        except Exception as e:
+            logger.error(f"Could not create itinerary job indexes: {str(e)}")
+
+    # Decode the itinerary templates once, before the first render needs them
+    try:
+        render_assets.preload()
+    except Exception as e:
+        logger.error(f"Could not preload itinerary templates: {str(e)}")
+
+def shutdown_process():
+    # Stop background work before closing the shared MongoDB pool
+    catalog.stop_catalog_refresher()
+    itinerary_jobs.shutdown_job_manager()
+    itinerary_renderer.shutdown_render_executor()
+    database.close_db_client()
+
+def error_response(e, route):
+    """(body, status, headers) for an exception raised while handling route."""
+    if isinstance(e, RequestError):
+        if e.status == 400:
+            logger.warning(f"Rejected {route} request: {str(e)}")
+        return {'error': str(e)}, e.status, e.headers
+    if isinstance(e, itinerary_renderer.UnknownTemplate):
+        return {'error': str(e)}, 400, {}
+    if isinstance(e, itinerary_jobs.JobQueueFull):
+        logger.warning(f"Rejected itinerary job: {str(e)}")
+        return {'error': 'Too many itinerary jobs pending, try again shortly'}, 503, {'Retry-After': '10'}
+    logger.error(f"Error in {route} route: {str(e)}")
+    return {'error': str(e)}, 500, {}
+
+def required_arg(args, name):
+    value = args.get(name)
+    if not value:
+        raise RequestError(f'{name} is required')
+    return value
+
+def required_body(body, message):
+    if not body:
+        raise RequestError(message)
+    return body
+
+def batch_entity_ids(body):
+    entity_ids = list(body.get('businessIds') or []) + list(body.get('locationIds') or [])
+    if not entity_ids:
+        raise RequestError('businessIds or locationIds is required')
+    if len(entity_ids) > review_summariser.SUMMARY_BATCH_MAX_IDS:
+        raise RequestError(f'At most {review_summariser.SUMMARY_BATCH_MAX_IDS} ids per request')
+    return entity_ids
+
+def render_request(body, field):
+    """(field value, template_id) of a render request body."""
+    value, template_id = body.get(field), body.get('template_id')
+    if not value or template_id is None:
+        raise RequestError(f'{field} and template_id are required')
+    return value, template_id
+
+def home_body():
+    return {'message': 'Welcome to the LLM API!'}
+
+def job_created(job):
+    return {'job_id': job['job_id'], 'status': job['status']}, 202, {'Location': f"{URL_PREFIX}/itinerary/jobs/{job['job_id']}"}
+
+def job_body(job):
+    if job is None:
+        raise RequestError('Job not found or expired', status=404)
+    return job
+
+def batch_lines(results):
+    """One JSON line per (entity_id, summary, error) from review_summariser.iter_summariser_batch."""
+    for entity_id, summary, error in results:
+        line = {'id': entity_id, 'summary': summary} if error is None else {'id': entity_id, 'error': error}
+        yield json.dumps(line) + '\n'
+
+# Server-Sent Events: one "event:"/"data:" block per message, data as JSON
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def sse_stream(events, route):
+    """SSE text for (event, data) pairs, framed by a "status" event and a closing "done" or "error"."""
+    # Sent straight away so the client sees the first byte before the LLM starts
+    yield sse_event('status', {'stage': 'started'})
+    try:
+        for event, data in events:
+            yield sse_event(event, data)
+        yield sse_event('done', {})
+    except Exception as e:
+        logger.error(f"Error in {route} stream: {str(e)}")
+        yield sse_event('error', {'error': str(e)})
+
+def summary_chunks(tokens):
+    return (('summary_chunk', token) for token in tokens)
+
+# Fast-path, cache, prompt size and render counters for this worker process
+def metrics():
+    return {
+        'query_parser': query_parser.parser_stats.stats(),
+        'query_cache': query_cache.get_query_cache().stats(),
+        'summary_cache': summary_cache.get_summary_cache().stats(),
+        'prompts': prompt_encoding.prompt_stats.stats(),
+        'render_cache': render_cache.get_render_cache().stats()
+    }
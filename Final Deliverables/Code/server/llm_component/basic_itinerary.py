@@ -1,8 +1,12 @@
-from PIL import Image, ImageDraw, ImageFont
 import json
 import os
 import sys
 
+if __package__ in (None, ""):
+    # Run as a script by the Node controllers: make the llm_component package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_component import render_assets
+
 def format_itinerary(sorted_itinerary):
     if isinstance(sorted_itinerary, str):
         try:
@@ -22,16 +26,8 @@ def overlay_text_on_template(route, template_path):
     if not os.path.exists(template_path):
         raise FileNotFoundError(f"Template image not found: {template_path}")
 
-    template = Image.open(template_path)  
-    draw = ImageDraw.Draw(template)
-    font = ImageFont.truetype("verdana.ttf", 30)
-    x, y = 50, 250
-    for line in route.split("\n"):
-        draw.text((x, y), line, fill="black", font=font)
-        y += 35
-    output_path = "user_itinerary.png"
-    template.save(output_path)
-    return output_path
+    # Saved under a hash of its content, so concurrent runs never overwrite each other's image
+    return render_assets.render_to_file(route, template_path)
 
 
 TEMPLATES = {
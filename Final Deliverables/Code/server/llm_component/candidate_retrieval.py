@@ -0,0 +1,91 @@
+"""Relevance-ranked business candidates for the AI itinerary prompts.
+
+Only a slice of the catalog fits in an LLM prompt, so ai_itinerary_components
+ranks every business against the question first and sends the best ones.
+A business scores for being close to a location the question names, for
+naming that location in its name or address, for being in a category the
+question asks for, and for its rating. Ranking is deterministic: the same
+question against the same catalog always yields the same candidates.
+
+Locations are recognised with query_parser's LocationMatcher; the server
+passes the one query_parser keeps per catalog version.
+"""
+import os
+import numpy as np
+from llm_component import geo, prompt_encoding, query_parser
+
+CANDIDATE_TOKEN_BUDGET = int(os.getenv("AI_ITINERARY_CANDIDATE_TOKENS", "4000"))
+# Distance at which the proximity score has halved
+PROXIMITY_SCALE_KM = float(os.getenv("AI_ITINERARY_PROXIMITY_SCALE_KM", "10"))
+
+WEIGHTS = {"proximity": 0.4, "category": 0.3, "location_name": 0.15, "rating": 0.15}
+
+# Fields the business grouping prompt sends, used to cost each candidate
+PROMPT_FIELDS = ("name", "category", "lon,lat")
+
+
+def mentioned_categories(question, business_categories):
+    """Business categories the question asks for, through the parser's keywords or by name."""
+    labels = query_parser.category_labels(question)
+    words = set(query_parser.tokenize(query_parser.query_text(question)))
+
+    wanted = set()
+    for category in business_categories:
+        category_text = str(category).lower()
+        if any(label in category_text for label in labels) or set(query_parser.tokenize(category_text)) & words:
+            wanted.add(category)
+    return wanted
+
+def _rating(details):
+    try:
+        return min(max(float(details[3] or 0), 0.0), 5.0) / 5
+    except (TypeError, ValueError):
+        return 0.0
+
+def rank_businesses(question, locations_data, business_data, matcher=None):
+    """business_data keys, best candidate first. matcher defaults to one built for locations_data."""
+    keys = list(business_data)
+    if not keys:
+        return []
+
+    matcher = matcher or query_parser.LocationMatcher(locations_data)
+    locations = query_parser.location_keys(question, matcher)
+    categories = mentioned_categories(question, {details[1] for details in business_data.values()})
+
+    scores = np.zeros(len(keys))
+    if locations:
+        distances = geo.haversine_matrix_km([business_data[key][2] for key in keys], [locations_data[location] for location in locations])
+        # Businesses without valid coordinates get no proximity score
+        nearest = np.where(np.isnan(distances), np.inf, distances).min(axis=1)
+        scores += WEIGHTS["proximity"] * PROXIMITY_SCALE_KM / (PROXIMITY_SCALE_KM + nearest)
+
+        location_names = [prompt_encoding.display_name(location).lower() for location in locations]
+        for i, key in enumerate(keys):
+            text = f"{key} {business_data[key][0]}".lower()
+            if any(name in text for name in location_names):
+                scores[i] += WEIGHTS["location_name"]
+
+    for i, key in enumerate(keys):
+        details = business_data[key]
+        if details[1] in categories:
+            scores[i] += WEIGHTS["category"]
+        scores[i] += WEIGHTS["rating"] * _rating(details)
+
+    # Stable sort on the catalog order breaks ties the same way every run
+    return [keys[i] for i in np.argsort(-scores, kind="stable")]
+
+def select_candidates(question, locations_data, business_data, max_tokens=None, matcher=None):
+    """The best-ranked businesses whose prompt rows fit in max_tokens, in rank order."""
+    max_tokens = CANDIDATE_TOKEN_BUDGET if max_tokens is None else max_tokens
+
+    candidates = {}
+    tokens = 0
+    for key in rank_businesses(question, locations_data, business_data, matcher):
+        details = business_data[key]
+        row = "|".join(str(prompt_encoding.BUSINESS_FIELDS[field](key, details)) for field in PROMPT_FIELDS)
+        row_tokens = prompt_encoding.estimate_tokens(row)
+        if tokens + row_tokens > max_tokens:
+            break
+        candidates[key] = details
+        tokens += row_tokens
+    return candidates
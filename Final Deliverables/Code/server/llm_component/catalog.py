@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import pymongo
+from llm_component import database
+
+logger = logging.getLogger(__name__)
+
+# Full reload at least this often, even if the watermark did not move (seconds)
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "600"))
+# How often the background thread checks the updatedAt watermark (seconds)
+CATALOG_WATERMARK_INTERVAL = float(os.getenv("CATALOG_WATERMARK_INTERVAL", "30"))
+
+LOCATION_PROJECTION = {"name": 1, "coordinates": 1, "updatedAt": 1}
+BUSINESS_PROJECTION = {"name": 1, "address": 1, "category": 1, "coordinates": 1, "averageRating": 1, "updatedAt": 1}
+
+
+class CatalogSnapshot:
+    """Immutable view of the Location and Business collections at one point in time."""
+
+    def __init__(self, version, watermark, locations_data, business_data):
+        self.version = version
+        self.watermark = watermark
+        self.locations_data = locations_data
+        self.business_data = business_data
+        self.loaded_at = time.time()
+        # Same value in every process for the same locations, unlike version, so it can key shared caches
+        self.locations_fingerprint = hashlib.sha1(json.dumps(locations_data, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_initial_load_lock = threading.Lock()
+_stop_event = threading.Event()
+_refresh_thread = None
+_refresher_lock = threading.Lock()
+
+
+def extract_locations_data(db):
+    """Extract location data in the same shape the itinerary processors expect."""
+    collection = db["Location"]
+    locations_data = {doc["name"]: doc["coordinates"]["coordinates"] for doc in collection.find({}, LOCATION_PROJECTION)}
+    locations_data = {f"[{index}]": value for index, value in locations_data.items()}
+    return locations_data
+
+def extract_business_data(db, include_location_id=False):
+    """Extract business data in the same shape the itinerary processors expect.
+
+    With include_location_id each entry gets the business's locationId as a fifth element.
+    """
+    collection = db["Business"]
+    projection = {**BUSINESS_PROJECTION, "locationId": 1} if include_location_id else BUSINESS_PROJECTION
+    business_data = {}
+    for doc in collection.find({}, projection):
+        business_data[doc["name"]] = [doc["address"], doc["category"], doc["coordinates"]["coordinates"], doc["averageRating"]]
+        if include_location_id:
+            business_data[doc["name"]].append(doc.get("locationId"))
+    business_data = {f"[{index}]": value for index, value in business_data.items()}
+    return business_data
+
+def ensure_catalog_indexes(db=None):
+    """Indexes that let read_watermark find the newest updatedAt without a collection scan."""
+    if db is None:
+        db = database.get_db()
+    return [db[name].create_index([("updatedAt", pymongo.DESCENDING)]) for name in ("Location", "Business")]
+
+def read_watermark(db):
+    """Return a cheap fingerprint of the catalog: newest updatedAt and document count per collection."""
+    watermark = []
+    for name in ("Location", "Business"):
+        collection = db[name]
+        latest = collection.find_one({}, {"updatedAt": 1}, sort=[("updatedAt", pymongo.DESCENDING)])
+        watermark.append((latest.get("updatedAt") if latest else None, collection.estimated_document_count()))
+    return tuple(watermark)
+
+def load_catalog(db=None):
+    """Load a fresh snapshot from the database and make it the current one."""
+    global _snapshot
+
+    if db is None:
+        db = database.get_db()
+
+    watermark = read_watermark(db)
+    locations_data = extract_locations_data(db)
+    business_data = extract_business_data(db)
+
+    with _snapshot_lock:
+        version = _snapshot.version + 1 if _snapshot else 1
+        _snapshot = CatalogSnapshot(version, watermark, locations_data, business_data)
+
+    logger.info(f"Catalog loaded (version {version}): {len(locations_data)} locations, {len(business_data)} businesses")
+    return _snapshot
+
+def get_catalog():
+    """Return the current snapshot, loading it on first use if the refresher has not run yet."""
+    if _snapshot is not None:
+        return _snapshot
+
+    # Only one request pays for the first load; the others wait and reuse it
+    with _initial_load_lock:
+        if _snapshot is not None:
+            return _snapshot
+        return load_catalog()
+
+def refresh_if_stale(db=None):
+    """Reload the catalog if the watermark moved or the refresh interval elapsed."""
+    snapshot = _snapshot
+    if snapshot is None or time.time() - snapshot.loaded_at >= CATALOG_REFRESH_INTERVAL:
+        return load_catalog(db)
+
+    if db is None:
+        db = database.get_db()
+
+    if read_watermark(db) == snapshot.watermark:
+        return snapshot
+    return load_catalog(db)
+
+def _refresh_loop():
+    while not _stop_event.wait(CATALOG_WATERMARK_INTERVAL):
+        try:
+            refresh_if_stale()
+        except Exception as e:
+            logger.error(f"Catalog refresh failed: {str(e)}")
+
+def start_catalog_refresher():
+    """Load the catalog and keep it fresh from a background thread.
+
+    Safe to call more than once and from several threads; after a fork the
+    child has no refresher thread, so the next call starts one.
+    """
+    global _refresh_thread
+
+    if _refresh_thread is not None and _refresh_thread.is_alive():
+        return
+
+    with _refresher_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+
+        try:
+            load_catalog()
+        except Exception as e:
+            # Requests will retry the load lazily through get_catalog()
+            logger.error(f"Initial catalog load failed: {str(e)}")
+
+        _stop_event.clear()
+        _refresh_thread = threading.Thread(target=_refresh_loop, name="catalog-refresher", daemon=True)
+        _refresh_thread.start()
+
+def stop_catalog_refresher():
+    """Stop the background refresher thread."""
+    global _refresh_thread
+
+    _stop_event.set()
+    if _refresh_thread is not None:
+        _refresh_thread.join(timeout=5)
+    _refresh_thread = None
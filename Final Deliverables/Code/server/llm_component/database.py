@@ -0,0 +1,99 @@
+import os
+import logging
+import threading
+import pymongo
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Absolute path, so scripts run from any folder pick up the server's config.env
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(dotenv_path=str(ROOT_DIR / "config.env"))
+
+logger = logging.getLogger(__name__)
+
+DATABASE_NAME = "OdysseumDatabase"
+
+# Pool settings, overridable per deployment through config.env
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "10000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "30000"))
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# Separate client for the ASGI server (llm_asgi.py); it is bound to that process's event loop
+_async_client = None
+
+
+def _client_options():
+    mongo_uri = os.getenv("MONGODB_URI_REMOTE")
+    if not mongo_uri:
+        logger.warning("MONGODB_URI_REMOTE environment variable not found!")
+
+    return dict(
+        host=mongo_uri,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+    )
+
+def create_db_client():
+    """Create a pooled MongoDB client from the configured settings."""
+    return pymongo.MongoClient(**_client_options())
+
+def get_db_client():
+    """Return the MongoClient shared by every module in this worker process."""
+    global _client, _client_pid
+
+    # MongoClient is not fork-safe, so a forked worker builds its own pool
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = create_db_client()
+            _client_pid = pid
+        return _client
+
+def get_db():
+    """Return the application database on the shared client."""
+    return get_db_client()[DATABASE_NAME]
+
+def close_db_client():
+    """Close the shared client. The next get_db_client() call opens a new pool."""
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+            logger.info("MongoDB client closed")
+        _client = None
+        _client_pid = None
+
+def get_async_db_client():
+    """Return the AsyncMongoClient shared by the coroutines of this process. Call from the event loop only."""
+    global _async_client
+
+    # Only the event loop thread touches it, so no lock is needed
+    if _async_client is None:
+        _async_client = pymongo.AsyncMongoClient(**_client_options())
+    return _async_client
+
+def get_async_db():
+    return get_async_db_client()[DATABASE_NAME]
+
+async def close_async_db_client():
+    global _async_client
+
+    if _async_client is not None:
+        await _async_client.close()
+        logger.info("Async MongoDB client closed")
+    _async_client = None
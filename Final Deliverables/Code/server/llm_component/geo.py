@@ -0,0 +1,76 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_lon_lat_array(coords_list):
+    """Convert a list of [longitude, latitude] pairs (GeoJSON order) into an (N, 2) float array.
+
+    Missing or malformed coordinates become NaN rows, which yield NaN distances.
+    """
+    try:
+        array = np.asarray(coords_list, dtype=float)
+        if array.ndim == 2 and array.shape[1] == 2:
+            return array
+    except (TypeError, ValueError):
+        pass
+
+    array = np.full((len(coords_list), 2), np.nan)
+    for i, coords in enumerate(coords_list):
+        try:
+            array[i, 0] = float(coords[0])
+            array[i, 1] = float(coords[1])
+        except (TypeError, ValueError, IndexError):
+            array[i] = np.nan
+    return array
+
+def _as_array(points):
+    if isinstance(points, np.ndarray):
+        return points.reshape(-1, 2).astype(float, copy=False)
+    return to_lon_lat_array(points)
+
+def haversine_km(origin, points):
+    """Great-circle distances in km from one [lon, lat] origin to N [lon, lat] points."""
+    points = _as_array(points)
+    origin = _as_array([origin])[0]
+
+    lon1, lat1 = np.radians(origin)
+    lon2 = np.radians(points[:, 0])
+    lat2 = np.radians(points[:, 1])
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_matrix_km(points_a, points_b=None):
+    """All-pairs great-circle distances in km, shape (len(points_a), len(points_b))."""
+    points_a = _as_array(points_a)
+    points_b = points_a if points_b is None else _as_array(points_b)
+
+    lon1 = np.radians(points_a[:, 0])[:, None]
+    lat1 = np.radians(points_a[:, 1])[:, None]
+    lon2 = np.radians(points_b[:, 0])[None, :]
+    lat2 = np.radians(points_b[:, 1])[None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def equirectangular_km(origin, points):
+    """Fast flat-earth approximation of haversine_km, accurate over the short hops of a single trip."""
+    points = _as_array(points)
+    origin = _as_array([origin])[0]
+
+    lon1, lat1 = np.radians(origin)
+    x = (np.radians(points[:, 0]) - lon1) * np.cos((np.radians(points[:, 1]) + lat1) / 2)
+    y = np.radians(points[:, 1]) - lat1
+    return EARTH_RADIUS_KM * np.hypot(x, y)
+
+def distance_km(coords1, coords2):
+    """Great-circle distance in km between two [lon, lat] points, or None if either is invalid."""
+    distance = haversine_km(coords1, [coords2])[0]
+    return None if np.isnan(distance) else float(distance)
+
+def rank_by_distance(origin, coords_list):
+    """Indices of coords_list ordered by distance from origin. Ties keep input order, invalid points go last."""
+    if not coords_list:
+        return []
+    return np.argsort(haversine_km(origin, coords_list), kind="stable").tolist()
@@ -0,0 +1,136 @@
+"""Geospatial queries pushed down to MongoDB ($geoNear against 2dsphere indexes).
+
+This is the opt-in alternative to ranking the in-memory catalog: only the
+businesses inside a radius or route corridor leave the database, already
+sorted by distance or rating. Enable it with ITINERARY_QUERY_MODE=geo.
+
+Create the indexes once per database from the server folder:
+    python -m llm_component.geo_queries
+"""
+import os
+import math
+import logging
+import pymongo
+from llm_component import database
+
+logger = logging.getLogger(__name__)
+
+QUERY_MODE_CATALOG = "catalog"
+QUERY_MODE_GEO = "geo"
+ITINERARY_QUERY_MODE = os.getenv("ITINERARY_QUERY_MODE", QUERY_MODE_CATALOG).lower()
+
+# Search radius around a destination, and half-width of the corridor around a route (km)
+GEO_QUERY_RADIUS_KM = float(os.getenv("GEO_QUERY_RADIUS_KM", "25"))
+GEO_CORRIDOR_WIDTH_KM = float(os.getenv("GEO_CORRIDOR_WIDTH_KM", "10"))
+
+KM_PER_DEGREE = 111.32
+
+BUSINESS_FIELDS = {"_id": 0, "name": 1, "address": 1, "category": 1, "coordinates": 1, "averageRating": 1, "distance": 1}
+
+
+def use_geo_queries(query_mode=None):
+    """True when the given (or configured) query mode asks for MongoDB-side filtering."""
+    return (query_mode or ITINERARY_QUERY_MODE).lower() == QUERY_MODE_GEO
+
+def ensure_geo_indexes(db=None):
+    """Create the 2dsphere indexes the $geoNear queries rely on. Safe to run repeatedly."""
+    if db is None:
+        db = database.get_db()
+
+    created = [
+        db["Location"].create_index([("coordinates", pymongo.GEOSPHERE)]),
+        # Same index models/Business.js declares; a second 2dsphere index would make $geoNear ambiguous
+        db["Business"].create_index([("coordinates", pymongo.GEOSPHERE)]),
+    ]
+    logger.info(f"Geo indexes ready: {created}")
+    return created
+
+def _point(coords):
+    return {"type": "Point", "coordinates": [float(coords[0]), float(coords[1])]}
+
+def _category_filter(category):
+    # Business.category values are capitalised ("Hotel"), requests use lower case
+    return {"category": category.capitalize()} if category else {}
+
+def _to_business(doc):
+    return {
+        "name": doc.get("name"),
+        "address": doc.get("address", ""),
+        "category": doc.get("category", ""),
+        "rating": doc.get("averageRating", 0),
+        "coordinates": doc.get("coordinates", {}).get("coordinates"),
+        "distance_km": round(doc["distance"] / 1000, 3) if "distance" in doc else None
+    }
+
+def _geo_near_pipeline(center, max_distance_km, query, sort_by, limit):
+    pipeline = [
+        {"$geoNear": {
+            "near": _point(center),
+            "key": "coordinates",
+            "distanceField": "distance",
+            "maxDistance": max_distance_km * 1000,
+            "spherical": True,
+            "query": query
+        }}
+    ]
+    # $geoNear already returns documents nearest first
+    if sort_by in ("rating", "ratings"):
+        pipeline.append({"$sort": {"averageRating": -1, "distance": 1}})
+    if limit:
+        pipeline.append({"$limit": int(limit)})
+    pipeline.append({"$project": BUSINESS_FIELDS})
+    return pipeline
+
+def find_businesses_near(center, category=None, max_distance_km=None, sort_by="distance", limit=None, db=None):
+    """Businesses within max_distance_km of a [longitude, latitude] point."""
+    if db is None:
+        db = database.get_db()
+    if max_distance_km is None:
+        max_distance_km = GEO_QUERY_RADIUS_KM
+
+    pipeline = _geo_near_pipeline(center, max_distance_km, _category_filter(category), sort_by, limit)
+    return [_to_business(doc) for doc in db["Business"].aggregate(pipeline)]
+
+def route_corridor(start, end, width_km=None):
+    """GeoJSON polygon covering a straight route from start to end, width_km on either side."""
+    if width_km is None:
+        width_km = GEO_CORRIDOR_WIDTH_KM
+
+    # Work in a local flat projection around the route; fine for trip-sized distances
+    lat0 = math.radians((start[1] + end[1]) / 2)
+    dx = (end[0] - start[0]) * KM_PER_DEGREE * math.cos(lat0)
+    dy = (end[1] - start[1]) * KM_PER_DEGREE
+    length = math.hypot(dx, dy) or 1.0
+
+    # Unit vectors along and across the route, scaled to width_km, back in degrees
+    ux, uy = dx / length * width_km, dy / length * width_km
+    along = (ux / (KM_PER_DEGREE * math.cos(lat0)), uy / KM_PER_DEGREE)
+    across = (-uy / (KM_PER_DEGREE * math.cos(lat0)), ux / KM_PER_DEGREE)
+
+    corners = [
+        [start[0] - along[0] + across[0], start[1] - along[1] + across[1]],
+        [end[0] + along[0] + across[0], end[1] + along[1] + across[1]],
+        [end[0] + along[0] - across[0], end[1] + along[1] - across[1]],
+        [start[0] - along[0] - across[0], start[1] - along[1] - across[1]],
+    ]
+    return {"type": "Polygon", "coordinates": [corners + [corners[0]]]}
+
+def find_businesses_along_route(start, end, category=None, width_km=None, sort_by="rating", limit=None, db=None):
+    """Businesses inside the corridor between two [longitude, latitude] points, distance measured from start."""
+    if db is None:
+        db = database.get_db()
+    if width_km is None:
+        width_km = GEO_CORRIDOR_WIDTH_KM
+
+    query = _category_filter(category)
+    query["coordinates"] = {"$geoWithin": {"$geometry": route_corridor(start, end, width_km)}}
+
+    # Nothing in the corridor is further from start than the route length plus the corridor
+    reach_km = math.hypot((end[0] - start[0]) * KM_PER_DEGREE, (end[1] - start[1]) * KM_PER_DEGREE) + 2 * width_km
+    pipeline = _geo_near_pipeline(start, reach_km, query, sort_by, limit)
+    return [_to_business(doc) for doc in db["Business"].aggregate(pipeline)]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ensure_geo_indexes()
@@ -0,0 +1,185 @@
+"""Background jobs for AI itinerary generation.
+
+POST /itinerary/jobs hands the query to a small bounded pool and returns a job
+id straight away, so the request worker is not held for the two o3-mini calls.
+Clients poll GET /itinerary/jobs/<id> until the status is "succeeded" or
+"failed". Finished jobs are kept for ITINERARY_JOB_RETENTION_SECONDS.
+
+With the default "mongo" store any gunicorn worker can answer the poll, not
+just the one that accepted the job. "memory" only suits a single process.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from llm_component import database, ItineraryAiProcessor
+
+logger = logging.getLogger(__name__)
+
+# Itineraries generated at once per process, and jobs allowed to wait behind them
+ITINERARY_JOB_MAX_WORKERS = int(os.getenv("ITINERARY_JOB_MAX_WORKERS", "4"))
+ITINERARY_JOB_MAX_QUEUED = int(os.getenv("ITINERARY_JOB_MAX_QUEUED", "32"))
+# How long a job and its result can be fetched after it was last updated
+ITINERARY_JOB_RETENTION_SECONDS = float(os.getenv("ITINERARY_JOB_RETENTION_SECONDS", "3600"))
+# "mongo" shares job state between worker processes, "memory" keeps it in this process
+ITINERARY_JOB_STORE = os.getenv("ITINERARY_JOB_STORE", "mongo").lower()
+JOB_COLLECTION = "ItineraryJob"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when ITINERARY_JOB_MAX_QUEUED jobs are already waiting or running."""
+
+
+class MemoryJobStore:
+    """Job state in a dict, visible to this process only."""
+
+    def __init__(self):
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        for job_id in [job_id for job_id, job in self.jobs.items() if job["expires_at"] <= now]:
+            del self.jobs[job_id]
+
+    def put(self, job):
+        with self._lock:
+            self._purge(time.time())
+            self.jobs[job["job_id"]] = dict(job)
+
+    def update(self, job_id, fields):
+        with self._lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class MongoJobStore:
+    """Job state in a MongoDB collection, removed by a TTL index once it expires."""
+
+    def __init__(self, collection_name=JOB_COLLECTION):
+        self.collection_name = collection_name
+
+    def _collection(self):
+        return database.get_db()[self.collection_name]
+
+    def ensure_indexes(self):
+        return self._collection().create_index("expireAt", expireAfterSeconds=0)
+
+    @staticmethod
+    def _expire_at(fields):
+        return {"expireAt": datetime.fromtimestamp(fields["expires_at"], tz=timezone.utc)} if "expires_at" in fields else {}
+
+    def put(self, job):
+        self._collection().insert_one({"_id": job["job_id"], **job, **self._expire_at(job)})
+
+    def update(self, job_id, fields):
+        self._collection().update_one({"_id": job_id}, {"$set": {**fields, **self._expire_at(fields)}})
+
+    def get(self, job_id):
+        return self._collection().find_one({"_id": job_id}, {"_id": 0, "expireAt": 0})
+
+
+class ItineraryJobManager:
+    """Runs ItineraryAiProcessor.run on a bounded pool and records each job's status and result."""
+
+    def __init__(self, store, max_workers=ITINERARY_JOB_MAX_WORKERS, max_queued=ITINERARY_JOB_MAX_QUEUED, retention_seconds=ITINERARY_JOB_RETENTION_SECONDS):
+        self.store = store
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="itinerary-job")
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, query, query_mode=None):
+        """Queue a job and return its record. Raises JobQueueFull when the backlog is at its limit."""
+        with self._lock:
+            if self.pending >= self.max_queued:
+                raise JobQueueFull(f"{self.pending} itinerary jobs already pending")
+            self.pending += 1
+
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": STATUS_QUEUED,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + self.retention_seconds,
+            "result": None,
+            "error": None
+        }
+        try:
+            self.store.put(job)
+            self.executor.submit(self._run, job["job_id"], query, query_mode)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        return job
+
+    def _update(self, job_id, **fields):
+        now = time.time()
+        fields.update(updated_at=now, expires_at=now + self.retention_seconds)
+        try:
+            self.store.update(job_id, fields)
+        except Exception as e:
+            logger.error(f"Could not update itinerary job {job_id}: {str(e)}")
+
+    def _run(self, job_id, query, query_mode):
+        try:
+            self._update(job_id, status=STATUS_RUNNING)
+            result = ItineraryAiProcessor.run(query, query_mode)
+            self._update(job_id, status=STATUS_SUCCEEDED, result=result)
+        except Exception as e:
+            logger.error(f"Itinerary job {job_id} failed: {str(e)}")
+            self._update(job_id, status=STATUS_FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def get(self, job_id):
+        """Return the job record, or None if it never existed or has expired."""
+        job = self.store.get(job_id)
+        # The TTL monitor only runs about once a minute, so check expiry here too
+        if job is None or job.get("expires_at", 0) <= time.time():
+            return None
+        return job
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_job_store(store=ITINERARY_JOB_STORE):
+    if store == "memory":
+        return MemoryJobStore()
+    return MongoJobStore()
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Process-wide job manager, configured from the ITINERARY_JOB_* settings."""
+    global _job_manager
+
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                _job_manager = ItineraryJobManager(create_job_store())
+    return _job_manager
+
+def shutdown_job_manager():
+    if _job_manager is not None:
+        _job_manager.shutdown()
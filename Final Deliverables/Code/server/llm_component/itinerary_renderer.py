@@ -0,0 +1,75 @@
+"""Itinerary image rendering inside the long-lived LLM server.
+
+The Node itinerary controllers used to spawn basic_itinerary.py or
+ai_itinerary_components.py for every request, paying interpreter start-up,
+the PIL/pymongo/langchain imports and a fresh MongoDB connection before any
+work. llm_server.py now exposes the same two code paths at
+/api/llm/itinerary/render and /api/llm/itinerary/renderAiItinerary, and runs
+them on a bounded pool of render threads, drawing on the templates and fonts
+render_assets keeps in memory and serving repeats from render_cache. The AI
+path reads the catalog snapshot and uses the shared Groq client instead of
+querying the Business collection per request.
+
+The scripts still work from the command line for callers that spawn them.
+"""
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from llm_component import ai_itinerary_components, basic_itinerary, catalog, llm_clients, query_parser, render_assets, render_cache
+from llm_component.render_assets import UnknownTemplate
+
+logger = logging.getLogger(__name__)
+
+# Renders run at once per process; requests beyond this wait for a free worker
+RENDER_MAX_WORKERS = int(os.getenv("RENDER_MAX_WORKERS", "4"))
+RENDER_TIMEOUT_SECONDS = float(os.getenv("RENDER_TIMEOUT_SECONDS", "180"))
+
+_render_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_render_executor():
+    global _render_executor
+    with _executor_lock:
+        if _render_executor is None:
+            _render_executor = ThreadPoolExecutor(max_workers=RENDER_MAX_WORKERS, thread_name_prefix="itinerary-render")
+        return _render_executor
+
+def shutdown_render_executor():
+    global _render_executor
+    with _executor_lock:
+        if _render_executor is not None:
+            _render_executor.shutdown(wait=False, cancel_futures=True)
+            _render_executor = None
+
+def render_text(text, template_id):
+    """PNG bytes of the text drawn on the template, from the render cache when it was drawn before."""
+    cache = render_cache.get_render_cache()
+    # Key and pixels come from the same template version, even if a reload lands meanwhile
+    version, template = render_assets.get_template_cache().current(template_id)
+    key = render_cache.render_key(text, template_id, version, render_assets.render_options())
+    image = cache.get(key)
+    if image is None:
+        image = render_assets.encode_png(render_assets.render_template(text, template))
+        cache.put(key, image)
+    return image
+
+def render_basic_itinerary(itinerary, template_id):
+    """basic_itinerary.py: a {day: [events]} itinerary (dict or JSON string) as PNG bytes."""
+    return render_text(basic_itinerary.format_itinerary(itinerary), template_id)
+
+def render_ai_itinerary(query, template_id):
+    """ai_itinerary_components.py: the route planned for a free-text query, as PNG bytes."""
+    render_assets.check_template_id(template_id)  # fail before the LLM calls, not after
+    snapshot = catalog.get_catalog()
+    business_category_data = list(dict.fromkeys(details[1] for details in snapshot.business_data.values()))
+
+    # No locationId in the snapshot: businesses go under their nearest location, as scraping/location_id.py assigns them
+    matcher = query_parser.get_location_matcher(snapshot)
+    route = ai_itinerary_components.create_route(query, snapshot.locations_data, snapshot.business_data, business_category_data, llm_clients.get_groq_chat(), location_matcher=matcher)
+    return render_text(route, template_id)
+
+def run_render(render, *args):
+    """Run a render_* function on the render pool and wait for its result."""
+    return get_render_executor().submit(render, *args).result(timeout=RENDER_TIMEOUT_SECONDS)
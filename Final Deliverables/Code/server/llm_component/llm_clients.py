@@ -0,0 +1,83 @@
+"""LLM clients shared by every llm_component module.
+
+Each client is created on first use and reused for the life of the worker
+process, so its keep-alive connection pool saves the TCP/TLS handshake on every
+call after the first. The sync clients are thread-safe; the async ones belong
+to the event loop of the ASGI server (llm_asgi.py).
+"""
+import os
+import threading
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from langchain_groq import ChatGroq
+
+AZURE_OPENAI_API_VERSION = "2025-03-01-preview"
+GROQ_MODEL = "llama-3.1-8b-instant"
+
+# Connection pool per client, and timeouts (seconds) for every LLM request
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "50"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# o3-mini can take well over a minute on long prompts
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def http_limits():
+    return httpx.Limits(max_connections=LLM_HTTP_MAX_CONNECTIONS, max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE, keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY)
+
+def http_timeout():
+    return httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+def _shared(name, factory):
+    global _clients_pid
+
+    # Connections are not fork-safe, so a forked worker opens its own
+    pid = os.getpid()
+    if _clients_pid == pid and name in _clients:
+        return _clients[name]
+
+    with _clients_lock:
+        if _clients_pid != pid:
+            _clients.clear()
+            _clients_pid = pid
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+def get_azure_client():
+    """Shared AzureOpenAI client (o3-mini)."""
+    return _shared("azure", lambda: AzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=AZURE_OPENAI_API_VERSION,
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        timeout=http_timeout(),
+        max_retries=LLM_MAX_RETRIES,
+        http_client=httpx.Client(limits=http_limits(), timeout=http_timeout())
+    ))
+
+def get_async_azure_client():
+    """Shared AsyncAzureOpenAI client. Use it from the ASGI server's event loop only."""
+    return _shared("azure_async", lambda: AsyncAzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=AZURE_OPENAI_API_VERSION,
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        timeout=http_timeout(),
+        max_retries=LLM_MAX_RETRIES,
+        http_client=httpx.AsyncClient(limits=http_limits(), timeout=http_timeout())
+    ))
+
+def get_groq_chat(model=GROQ_MODEL):
+    """Shared ChatGroq model; invoke/stream use the sync pool, ainvoke/astream the async one."""
+    return _shared(f"groq:{model}", lambda: ChatGroq(
+        model=model,
+        timeout=http_timeout(),
+        max_retries=LLM_MAX_RETRIES,
+        http_client=httpx.Client(limits=http_limits(), timeout=http_timeout()),
+        http_async_client=httpx.AsyncClient(limits=http_limits(), timeout=http_timeout())
+    ))
@@ -0,0 +1,165 @@
+"""Compact, token-budgeted encoding of catalog data for LLM prompts.
+
+Catalog rows go into prompts as one "id|field|field" line each, under short ids
+(L1, B7, ...), with only the fields the prompt needs, no JSON indentation, and
+coordinates rounded to about 100 m. The LLM answers with the ids, and the
+EncodedTable that produced the prompt maps them back to catalog keys, so names,
+addresses and coordinates never have to be copied through the model.
+
+Tables stop adding rows once they reach their token budget. Every call reports
+its estimated prompt size, and the provider's own count when the response has
+one, to the log and to prompt_stats (exposed on /api/llm/metrics).
+"""
+import os
+import json
+import logging
+import threading
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+COORDINATE_DECIMALS = 3
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+def compact_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def display_name(key):
+    # Catalog keys are "[Name]"
+    return str(key).strip("[]")
+
+def format_coordinates(coords):
+    try:
+        return f"{float(coords[0]):.{COORDINATE_DECIMALS}f},{float(coords[1]):.{COORDINATE_DECIMALS}f}"
+    except (TypeError, ValueError, IndexError):
+        return ""
+
+def _cell(value):
+    # The separator and line breaks would split a row
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+class EncodedTable:
+    """Catalog rows as prompt text, with the id -> catalog key map needed to read the answer."""
+
+    def __init__(self, text, keys, total_rows):
+        self.text = text
+        self.keys = keys
+        self.total_rows = total_rows
+        self._by_name = {display_name(key).lower(): key for key in keys.values()}
+
+    @property
+    def truncated(self):
+        return len(self.keys) < self.total_rows
+
+    def decode(self, value):
+        """Catalog key for an id from this table, or for a name the LLM echoed instead; None if unknown."""
+        value = str(value).strip()
+        if value in self.keys:
+            return self.keys[value]
+        return self._by_name.get(display_name(value).lower())
+
+
+def encode_table(rows, columns, prefix, budget_tokens=None):
+    """Encode (catalog key, [column values]) rows as "id|col|col" lines, stopping at budget_tokens."""
+    budget_tokens = PROMPT_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+    rows = list(rows)
+
+    lines = ["|".join(["id"] + list(columns))]
+    tokens = estimate_tokens(lines[0])
+    keys = {}
+    for i, (key, values) in enumerate(rows, 1):
+        line = "|".join([f"{prefix}{i}"] + [_cell(value) for value in values])
+        line_tokens = estimate_tokens(line)
+        if tokens + line_tokens > budget_tokens:
+            logger.warning(f"Prompt table {prefix}: kept {len(keys)} of {len(rows)} rows within {budget_tokens} tokens")
+            break
+        lines.append(line)
+        keys[f"{prefix}{i}"] = key
+        tokens += line_tokens
+
+    return EncodedTable("\n".join(lines), keys, len(rows))
+
+def encode_locations(locations_data, with_coordinates=False, budget_tokens=None):
+    columns = ["name", "lon,lat"] if with_coordinates else ["name"]
+    rows = (
+        (key, [display_name(key), format_coordinates(coords)] if with_coordinates else [display_name(key)])
+        for key, coords in locations_data.items()
+    )
+    return encode_table(rows, columns, "L", budget_tokens)
+
+# Field extractors for business_data values: [address, category, coordinates, averageRating, (locationId)]
+BUSINESS_FIELDS = {
+    "name": lambda key, details: display_name(key),
+    "address": lambda key, details: details[0],
+    "category": lambda key, details: details[1],
+    "lon,lat": lambda key, details: format_coordinates(details[2]),
+    "rating": lambda key, details: details[3],
+}
+
+def encode_businesses(business_data, fields=("name", "category", "rating"), budget_tokens=None):
+    """Encode businesses with only the given BUSINESS_FIELDS, in the order business_data yields them."""
+    rows = ((key, [BUSINESS_FIELDS[field](key, details) for field in fields]) for key, details in business_data.items())
+    return encode_table(rows, fields, "B", budget_tokens)
+
+
+def _message_text(message):
+    if isinstance(message, str):
+        return message
+    if isinstance(message, dict):
+        return message.get("content", "")
+    return getattr(message, "content", "")
+
+def _provider_prompt_tokens(response):
+    # OpenAI responses carry usage.prompt_tokens, LangChain messages usage_metadata["input_tokens"]
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        return usage.prompt_tokens
+    usage_metadata = getattr(response, "usage_metadata", None)
+    if usage_metadata:
+        return usage_metadata.get("input_tokens")
+    return None
+
+
+class PromptStats:
+    """Per-prompt call counts and token totals for this process."""
+
+    def __init__(self):
+        self.prompts = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, estimated_tokens, prompt_tokens=None):
+        with self._lock:
+            entry = self.prompts.setdefault(name, {"calls": 0, "estimated_tokens": 0, "prompt_tokens": 0, "reported_calls": 0})
+            entry["calls"] += 1
+            entry["estimated_tokens"] += estimated_tokens
+            if prompt_tokens is not None:
+                entry["prompt_tokens"] += prompt_tokens
+                entry["reported_calls"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "calls": entry["calls"],
+                    "avg_estimated_tokens": round(entry["estimated_tokens"] / entry["calls"]),
+                    "avg_prompt_tokens": round(entry["prompt_tokens"] / entry["reported_calls"]) if entry["reported_calls"] else None
+                }
+                for name, entry in self.prompts.items()
+            }
+
+
+prompt_stats = PromptStats()
+
+
+def report_prompt(name, messages, response=None):
+    """Log and record the size of one LLM call's prompt; pass the response to include the provider's count."""
+    estimated = sum(estimate_tokens(_message_text(message)) for message in messages)
+    prompt_tokens = _provider_prompt_tokens(response) if response is not None else None
+    prompt_stats.record(name, estimated, prompt_tokens)
+    logger.info(f"Prompt {name}: ~{estimated} tokens estimated" + (f", {prompt_tokens} reported" if prompt_tokens is not None else ""))
+    return prompt_tokens if prompt_tokens is not None else estimated
@@ -0,0 +1,89 @@
+"""Cache of LLM query extractions for AI itineraries.
+
+Maps a normalised query (casefolded, punctuation and whitespace collapsed) to
+the optimization, locations and stops the LLM extracted from it, so popular
+trips only pay for the LLM once. Entries are only valid for the catalog they
+were extracted against: the snapshot's locations fingerprint plays the part
+the review watermark plays in summary_cache, and any change to the locations
+turns the old entries into misses.
+
+It reuses summary_cache.SummaryCache for LRU eviction, TTL, hit/miss counters
+and the optional Mongo or disk tier.
+"""
+import os
+import re
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from llm_component import query_parser
+from llm_component.summary_cache import SummaryCache, MongoSummaryStore, DiskSummaryStore
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "1") == "1"
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "5000"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "604800"))
+# Optional persistent tier behind the in-memory LRU: "none", "mongo" or "disk"
+QUERY_CACHE_PERSISTENCE = os.getenv("QUERY_CACHE_PERSISTENCE", "none").lower()
+QUERY_CACHE_DIR = os.getenv("QUERY_CACHE_DIR", str(Path(__file__).resolve().parent.parent / ".query_cache"))
+QUERY_CACHE_COLLECTION = "QueryExtractionCache"
+
+
+def normalize_query(query):
+    """Casefold, drop punctuation and collapse whitespace, so trivially different spellings share an entry."""
+    text = query_parser.query_text(query).casefold()
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+def query_key(query):
+    # Hashed so the key is safe as a file name and a Mongo _id whatever the query contains
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+def create_query_store(persistence=QUERY_CACHE_PERSISTENCE):
+    if persistence == "mongo":
+        return MongoSummaryStore(QUERY_CACHE_COLLECTION)
+    if persistence == "disk":
+        return DiskSummaryStore(QUERY_CACHE_DIR)
+    return None
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """Process-wide query cache, configured from the QUERY_CACHE_* settings."""
+    global _query_cache
+
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = SummaryCache(max_entries=QUERY_CACHE_MAX_ENTRIES, ttl_seconds=QUERY_CACHE_TTL_SECONDS, store=create_query_store())
+    return _query_cache
+
+def get_extraction(query, snapshot):
+    """Cached (optimization, location_predictions, stop_predictions) for this query and catalog, or None."""
+    if not QUERY_CACHE_ENABLED or not normalize_query(query):
+        return None
+
+    entry = get_query_cache().get(query_key(query), (snapshot.locations_fingerprint,))
+    if entry is None:
+        return None
+    # Locations are stored as pairs: location names may contain dots, which Mongo field names cannot
+    return entry["optimization"], dict(entry["locations"]), entry["stop_predictions"]
+
+def put_extraction(query, snapshot, extracted):
+    if not QUERY_CACHE_ENABLED or not normalize_query(query):
+        return
+    optimization, location_predictions, stop_predictions = extracted
+    value = {"optimization": optimization, "locations": [[name, coords] for name, coords in location_predictions.items()], "stop_predictions": stop_predictions}
+    get_query_cache().put(query_key(query), (snapshot.locations_fingerprint,), value, query=normalize_query(query))
+
+# For llm_asgi.py: only a persistent tier makes cache calls block on I/O
+async def aget_extraction(query, snapshot):
+    if get_query_cache().store is None:
+        return get_extraction(query, snapshot)
+    return await asyncio.to_thread(get_extraction, query, snapshot)
+
+async def aput_extraction(query, snapshot, extracted):
+    if get_query_cache().store is None:
+        return put_extraction(query, snapshot, extracted)
+    return await asyncio.to_thread(put_extraction, query, snapshot, extracted)
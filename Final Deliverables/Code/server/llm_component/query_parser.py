@@ -0,0 +1,285 @@
+"""Local parser for simple AI itinerary queries.
+
+Queries such as "Murree to Nathia Gali with a restaurant and a hotel" name
+catalog locations and stop categories outright, so they can be answered
+without an LLM round trip. parse_query() fuzzy-matches location names against
+the catalog, picks up category and optimization keywords, and scores how much
+of the query it understood. ItineraryAiProcessor only calls the LLM when that
+confidence is below QUERY_PARSER_MIN_CONFIDENCE.
+"""
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from difflib import SequenceMatcher
+
+QUERY_PARSER_ENABLED = os.getenv("QUERY_PARSER_ENABLED", "1") == "1"
+QUERY_PARSER_MIN_CONFIDENCE = float(os.getenv("QUERY_PARSER_MIN_CONFIDENCE", "0.8"))
+# Similarity needed for a run of query words to count as a location name (absorbs typos like "Muree")
+LOCATION_MATCH_THRESHOLD = float(os.getenv("QUERY_PARSER_LOCATION_MATCH", "0.85"))
+
+# Keywords per stop category; keys match ItineraryAiProcessor.STOP_CATEGORIES
+CATEGORY_KEYWORDS = {
+    "hotel": ["hotel", "hotels", "stay", "resort", "resorts", "lodge", "motel", "inn", "guest house", "guesthouse", "accommodation", "sleep", "overnight"],
+    "restaurant": ["restaurant", "restaurants", "food", "eat", "lunch", "dinner", "breakfast", "cafe", "cafes", "dhaba", "meal", "meals"],
+    "entertainment": ["entertainment", "fun", "park", "parks", "museum", "museums", "cinema", "sightseeing", "activity", "activities", "attraction", "attractions"],
+    "services": ["services", "service", "petrol", "fuel", "gas station", "atm", "mechanic", "pharmacy", "hospital", "workshop"],
+}
+
+OPTIMIZATION_KEYWORDS = {
+    "rating": ["best", "top", "top rated", "highly rated", "highest rated", "rating", "ratings", "popular"],
+    "distance": ["nearest", "closest", "shortest", "distance", "nearby", "quickest", "fastest"],
+    "cost": ["cheap", "cheapest", "budget", "affordable", "cost", "price", "inexpensive"],
+}
+
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+
+# Words that carry no trip information, so leaving them unmatched costs no confidence
+FILLER_WORDS = {
+    "to", "from", "and", "with", "a", "an", "the", "via", "through", "then", "i", "we", "me", "us", "my", "our",
+    "want", "would", "like", "need", "plan", "trip", "journey", "travel", "go", "going", "visit", "route",
+    "stop", "stops", "at", "in", "on", "for", "some", "please", "along", "way", "also", "place", "places", "good",
+    "start", "starting", "end", "ending", "day", "drive", "road", "of", "by", "near", "around",
+}
+
+MAX_STOPS = 10
+
+# Words that turn a nearby category keyword around ("without food", "avoid hotels", "only restaurants").
+# "don't" tokenizes to "don" + "t".
+NEGATION_WORDS = {"without", "no", "avoid", "not", "don", "dont", "except", "only", "skip"}
+# How far before and after a category keyword a negation word still applies to it ("don't need a hotel" is 4 tokens)
+NEGATION_WINDOW_BEFORE = 4
+NEGATION_WINDOW_AFTER = 2
+
+# Words the fuzzy location pass never needs to look at
+KNOWN_WORDS = FILLER_WORDS | set(NUMBER_WORDS) | NEGATION_WORDS | {
+    word for keywords in (CATEGORY_KEYWORDS, OPTIMIZATION_KEYWORDS) for phrases in keywords.values() for phrase in phrases for word in phrase.split()
+}
+
+
+def query_text(query):
+    """The free text of a request body: a bare string, or the "query" field of a JSON object."""
+    if isinstance(query, str):
+        return query
+    if isinstance(query, dict):
+        if isinstance(query.get("query"), str):
+            return query["query"]
+        return " ".join(value for value in query.values() if isinstance(value, str))
+    return ""
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class LocationMatcher:
+    """Fuzzy matcher over the catalog's location names, built once per catalog snapshot."""
+
+    def __init__(self, locations_data):
+        self.exact = {}
+        # (word count, first letter) -> [(name length, name text, catalog key, coordinates)] sorted by length.
+        # Fuzzy matching assumes the first letter is right, which keeps typo matching cheap on big catalogs.
+        self.by_words = {}
+        for key, coords in locations_data.items():
+            tokens = tokenize(key.strip("[]"))
+            if not tokens:
+                continue
+            name_text = " ".join(tokens)
+            self.exact.setdefault(name_text, (key, coords))
+            self.by_words.setdefault((len(tokens), name_text[0]), []).append((len(name_text), name_text, key, coords))
+        for names in self.by_words.values():
+            names.sort(key=lambda name: name[0])
+        self.max_words = max((word_count for word_count, _ in self.by_words), default=0)
+
+    def _fuzzy_candidates(self, window, word_counts):
+        # ratio() can only reach the threshold when the lengths are within this band
+        lo = len(window) * LOCATION_MATCH_THRESHOLD / (2 - LOCATION_MATCH_THRESHOLD)
+        hi = len(window) * (2 - LOCATION_MATCH_THRESHOLD) / LOCATION_MATCH_THRESHOLD
+        for word_count in word_counts:
+            names = self.by_words.get((word_count, window[0]), [])
+            for i in range(bisect_left(names, (lo,)), bisect_right(names, (hi, "\uffff"))):
+                yield names[i]
+
+    def match(self, tokens, skip_words=frozenset()):
+        """Non-overlapping location matches as (start, end, score, key, coords), in query order.
+
+        Exact names are claimed first; only words left over that are not in skip_words go through the fuzzy pass.
+        """
+        matches = []
+        claimed = set()
+        for width in range(min(self.max_words, len(tokens)), 0, -1):
+            for start in range(0, len(tokens) - width + 1):
+                span = range(start, start + width)
+                hit = None if claimed.intersection(span) else self.exact.get(" ".join(tokens[start:start + width]))
+                if hit:
+                    matches.append((start, start + width, 1.0, hit[0], hit[1]))
+                    claimed.update(span)
+
+        free = {i for i, token in enumerate(tokens) if i not in claimed and token not in skip_words}
+        best = {}
+        matcher = SequenceMatcher(autojunk=False)
+        # Windows one word wider or narrower than a name catch "Nathiagali" vs "Nathia Gali"
+        for width in range(1, min(self.max_words + 1, len(tokens)) + 1):
+            for start in range(0, len(tokens) - width + 1):
+                span = range(start, start + width)
+                if claimed.intersection(span) or not free.intersection(span):
+                    continue
+                window = " ".join(tokens[start:start + width])
+                # SequenceMatcher indexes its second sequence, so set the window once and vary the name
+                matcher.set_seq2(window)
+                for _, name_text, key, coords in self._fuzzy_candidates(window, (width - 1, width, width + 1)):
+                    matcher.set_seq1(name_text)
+                    if matcher.quick_ratio() < LOCATION_MATCH_THRESHOLD:
+                        continue
+                    score = matcher.ratio()
+                    if score >= LOCATION_MATCH_THRESHOLD and (key not in best or score > best[key][2]):
+                        best[key] = (start, start + width, score, key, coords)
+
+        # Strongest fuzzy matches claim their words first
+        for candidate in sorted(best.values(), key=lambda c: (-c[2], -(c[1] - c[0]))):
+            if not claimed.intersection(range(candidate[0], candidate[1])):
+                matches.append(candidate)
+                claimed.update(range(candidate[0], candidate[1]))
+        return sorted(matches)
+
+
+def _keyword_spans(tokens, keywords, used):
+    """(start, end, label) for every keyword phrase found in words not yet claimed."""
+    spans = []
+    for label, phrases in keywords.items():
+        for phrase in phrases:
+            phrase_tokens = phrase.split()
+            width = len(phrase_tokens)
+            for start in range(0, len(tokens) - width + 1):
+                if tokens[start:start + width] == phrase_tokens and not used.intersection(range(start, start + width)):
+                    spans.append((start, start + width, label))
+    # Longest phrase wins where phrases overlap ("top rated" over "top")
+    chosen = []
+    for span in sorted(spans, key=lambda s: (-(s[1] - s[0]), s[0])):
+        if all(span[1] <= other[0] or span[0] >= other[1] for other in chosen):
+            chosen.append(span)
+    return sorted(chosen)
+
+def _stop_count(tokens, start, used):
+    # "two hotels" / "2 restaurants"; anything else is a single stop
+    if start > 0 and start - 1 not in used:
+        word = tokens[start - 1]
+        if word.isdigit():
+            return min(int(word), MAX_STOPS), start - 1
+        if word in NUMBER_WORDS:
+            return NUMBER_WORDS[word], start - 1
+    return 1, None
+
+def category_labels(query):
+    """Stop categories the query's keywords name, e.g. {"restaurant", "hotel"}."""
+    tokens = tokenize(query_text(query))
+    return {label for _, _, label in _keyword_spans(tokens, CATEGORY_KEYWORDS, set())}
+
+def location_keys(query, matcher):
+    """Catalog keys of the locations the query names, in the order it names them."""
+    matches = matcher.match(tokenize(query_text(query)), KNOWN_WORDS)
+    return list(dict.fromkeys(key for _, _, _, key, _ in matches))
+
+def has_negated_category(tokens, category_spans):
+    """True if a negation or exclusion word sits close to any category keyword."""
+    for start, end, _ in category_spans:
+        window = tokens[max(start - NEGATION_WINDOW_BEFORE, 0):start] + tokens[end:end + NEGATION_WINDOW_AFTER]
+        if NEGATION_WORDS.intersection(window):
+            return True
+    return False
+
+def parse_query(query, matcher):
+    """Return (optimization, location_predictions, stop_predictions, confidence), or None if nothing was recognised."""
+    tokens = tokenize(query_text(query))
+    if not tokens:
+        return None
+
+    used = set()
+    locations = matcher.match(tokens, KNOWN_WORDS)
+    if not locations:
+        return None
+    location_predictions = {}
+    for start, end, _, key, coords in locations:
+        location_predictions.setdefault(key, coords)
+        used.update(range(start, end))
+
+    stops = []
+    category_spans = _keyword_spans(tokens, CATEGORY_KEYWORDS, used)
+    for start, end, category in category_spans:
+        count, count_index = _stop_count(tokens, start, used)
+        if count_index is not None:
+            used.add(count_index)
+        used.update(range(start, end))
+        stops.extend({"category": category} for _ in range(count))
+    stops = stops[:MAX_STOPS]
+
+    optimization = "rating"
+    optimization_spans = _keyword_spans(tokens, OPTIMIZATION_KEYWORDS, used)
+    if optimization_spans:
+        optimization = optimization_spans[0][2]
+    for start, end, _ in optimization_spans:
+        used.update(range(start, end))
+
+    # Confidence: weakest location match, times how much of the query was accounted for
+    unexplained = [token for i, token in enumerate(tokens) if i not in used and token not in FILLER_WORDS]
+    coverage = 1 - len(unexplained) / len(tokens)
+    confidence = min(score for _, _, score, _, _ in locations) * coverage
+    if not stops:
+        # The itinerary needs at least one stop category; leave vaguer requests to the LLM
+        confidence *= 0.5
+    if has_negated_category(tokens, category_spans):
+        # The parser cannot tell wanted from unwanted categories, so always leave these to the LLM
+        confidence = 0.0
+
+    stop_predictions = {"number_of_stops": len(stops), "stops": stops}
+    return optimization, location_predictions, stop_predictions, round(confidence, 3)
+
+
+_matcher = None
+_matcher_version = None
+_matcher_lock = threading.Lock()
+
+
+def get_location_matcher(snapshot):
+    """LocationMatcher for the snapshot's locations, rebuilt only when the catalog version changes."""
+    global _matcher, _matcher_version
+
+    with _matcher_lock:
+        if _matcher is None or _matcher_version != snapshot.version:
+            _matcher = LocationMatcher(snapshot.locations_data)
+            _matcher_version = snapshot.version
+        return _matcher
+
+
+class ParserStats:
+    """Counts how often the fast path answered a query instead of the LLM."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else None}
+
+
+parser_stats = ParserStats()
+
+
+def try_fast_path(query, snapshot):
+    """Parsed (optimization, location_predictions, stop_predictions) when the parser is confident enough, else None."""
+    if not QUERY_PARSER_ENABLED:
+        return None
+
+    parsed = parse_query(query, get_location_matcher(snapshot))
+    hit = parsed is not None and parsed[3] >= QUERY_PARSER_MIN_CONFIDENCE
+    parser_stats.record(hit)
+    return parsed[:3] if hit else None
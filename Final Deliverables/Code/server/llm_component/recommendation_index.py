@@ -0,0 +1,182 @@
+import bisect
+import threading
+import numpy as np
+from llm_component import geo, spatial_index, ItineraryProcessor
+
+OPTIMIZATIONS = ("ratings", "distance")
+
+
+def normalize_optimization(optimization):
+    """Map a request's optimization onto an index key. Anything but distance ranks by rating."""
+    return "distance" if str(optimization or "").lower() == "distance" else "ratings"
+
+def _rating_value(rating):
+    try:
+        return float(rating or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RecommendationIndex:
+    """Ranked businesses keyed by (location, category, optimization).
+
+    Businesses are bucketed by (location, category) up front, but a bucket is
+    only sorted the first time a request asks for it. The sorted list is then
+    kept, so later requests for the same pair are a slice, and a changed
+    business only has to be moved within the lists that already exist.
+    """
+
+    def __init__(self, locations_data, business_data, location_index=None):
+        self.locations_data = locations_data
+        self.location_index = location_index or spatial_index.LocationGridIndex(locations_data)
+        self.central_points = {loc_name.strip("[]"): ItineraryProcessor.find_central_point(loc_name.strip("[]"), locations_data) for loc_name in locations_data}
+        self.business_data = {}
+        self.entries = {}
+        self.buckets = {}
+        self.ranked = {}
+        # Catalog position of every business, indexed or not, so a business that moves
+        # into an indexed category keeps its place in the tie-break
+        self.orders = {}
+        self._next_order = 0
+        self._lock = threading.RLock()
+
+        for business_key, business_value in business_data.items():
+            self._add(business_key, business_value)
+
+    def _sort_keys(self, location, business_keys, optimization):
+        # Same orderings as generate_optimized_business_data, with catalog order breaking ties.
+        # Keys are stored on the entry so removal finds the exact tuple that was inserted.
+        if optimization == "distance":
+            coords_list = [self.entries[business_key][0]["coordinates"] for business_key in business_keys]
+            distances = np.nan_to_num(geo.haversine_km(self.central_points[location], coords_list), nan=np.inf).tolist()
+        else:
+            distances = None
+
+        sort_keys = []
+        for i, business_key in enumerate(business_keys):
+            business, _, _, order, entry_keys = self.entries[business_key]
+            primary = distances[i] if distances is not None else -_rating_value(business["rating"])
+            entry_keys[optimization] = (primary, order)
+            sort_keys.append((entry_keys[optimization], business_key))
+        return sort_keys
+
+    def _add(self, business_key, business_value):
+        self.business_data[business_key] = business_value
+        if business_key not in self.orders:
+            self.orders[business_key] = self._next_order
+            self._next_order += 1
+        order = self.orders[business_key]
+
+        business_coords = business_value[2] if len(business_value) > 2 else None
+        if not business_coords:
+            return
+
+        location = self.location_index.nearest(business_coords)
+        category = str(business_value[1] if len(business_value) > 1 else "").lower()
+        if not location or category not in ItineraryProcessor.CATEGORIES:
+            return
+
+        business = {
+            "name": business_key.strip("[]"),
+            "address": business_value[0] if len(business_value) > 0 else "",
+            "category": business_value[1],
+            "rating": business_value[3] if len(business_value) > 3 else "N/A",
+            "coordinates": business_coords
+        }
+        self.entries[business_key] = (business, location, category, order, {})
+        self.buckets.setdefault((location, category), set()).add(business_key)
+
+        # Only lists that were already requested need to stay in sync
+        for optimization in OPTIMIZATIONS:
+            ranked = self.ranked.get((location, category, optimization))
+            if ranked is not None:
+                bisect.insort(ranked, self._sort_keys(location, [business_key], optimization)[0])
+
+    def _remove(self, business_key):
+        self.business_data.pop(business_key, None)
+        if business_key not in self.entries:
+            return
+
+        _, location, category, _, entry_keys = self.entries[business_key]
+        for optimization, sort_key in entry_keys.items():
+            ranked = self.ranked.get((location, category, optimization))
+            if ranked is not None:
+                del ranked[bisect.bisect_left(ranked, (sort_key, business_key))]
+
+        self.buckets[(location, category)].discard(business_key)
+        del self.entries[business_key]
+
+    def _forget(self, business_key):
+        # The business left the catalog; if it comes back it is new and goes last
+        self._remove(business_key)
+        self.orders.pop(business_key, None)
+
+    def _ranked(self, location, category, optimization):
+        key = (location, category, optimization)
+        ranked = self.ranked.get(key)
+        if ranked is None:
+            bucket = list(self.buckets.get((location, category), ()))
+            ranked = sorted(self._sort_keys(location, bucket, optimization))
+            self.ranked[key] = ranked
+        return ranked
+
+    def upsert_business(self, business_key, business_value):
+        """Add a business or re-rank it after its rating, category or coordinates changed."""
+        with self._lock:
+            self._remove(business_key)
+            self._add(business_key, business_value)
+
+    def remove_business(self, business_key):
+        with self._lock:
+            self._forget(business_key)
+
+    def apply_catalog_changes(self, business_data):
+        """Bring the index in line with a newer business catalog, touching only what changed."""
+        with self._lock:
+            for business_key in [key for key in self.business_data if key not in business_data]:
+                self._forget(business_key)
+
+            changed = 0
+            for business_key, business_value in business_data.items():
+                if self.business_data.get(business_key) != business_value:
+                    self._remove(business_key)
+                    self._add(business_key, business_value)
+                    changed += 1
+            return changed
+
+    def top(self, location, category, optimization, top_n=5):
+        """Top-N businesses for one location and category, ranking that pair on first use."""
+        if location not in self.central_points:
+            raise KeyError(location)
+        if category not in ItineraryProcessor.CATEGORIES:
+            raise KeyError(category)
+
+        with self._lock:
+            ranked = self._ranked(location, category, normalize_optimization(optimization))
+            return [dict(self.entries[business_key][0]) for _, business_key in ranked[:top_n]]
+
+
+_cached_index = None
+_cached_version = None
+_cache_lock = threading.Lock()
+
+
+def get_recommendation_index(snapshot, location_index=None):
+    """Return the index for a catalog snapshot.
+
+    When only businesses changed since the cached version, the cached index is
+    updated in place instead of being rebuilt.
+    """
+    global _cached_index, _cached_version
+
+    with _cache_lock:
+        if _cached_index is not None and _cached_version == snapshot.version:
+            return _cached_index
+
+        if _cached_index is not None and _cached_index.locations_data == snapshot.locations_data:
+            _cached_index.apply_catalog_changes(snapshot.business_data)
+        else:
+            _cached_index = RecommendationIndex(snapshot.locations_data, snapshot.business_data, location_index)
+
+        _cached_version = snapshot.version
+        return _cached_index
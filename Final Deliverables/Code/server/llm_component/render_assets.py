@@ -0,0 +1,217 @@
+"""Decoded itinerary templates and fonts, kept in memory between renders.
+
+Opening a template PNG and loading the font dominated each render, so the LLM
+server decodes every template once and hands each render a copy of the base
+image. Templates are re-checked at most every RENDER_TEMPLATE_CHECK_INTERVAL
+seconds: a changed file (mtime/size) or a newer Template document, as written
+by templates/template_to_mongo.js, is decoded again and replaces the old one.
+
+RENDER_TEMPLATE_SOURCE picks where templates come from: "file" reads the
+templates folder, "mongo" the Template collection, falling back to the file
+for ids that are not in the collection.
+"""
+import io
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from PIL import Image, ImageDraw, ImageFont
+from llm_component import database, render_cache
+
+logger = logging.getLogger(__name__)
+
+RENDER_TEMPLATE_SOURCE = os.getenv("RENDER_TEMPLATE_SOURCE", "file").lower()
+RENDER_TEMPLATE_CHECK_INTERVAL = float(os.getenv("RENDER_TEMPLATE_CHECK_INTERVAL", "30"))
+RENDER_FONT = os.getenv("RENDER_FONT", "verdana.ttf")
+RENDER_FONT_SIZE = 30
+TEMPLATE_COLLECTION = "Template"
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "templates"
+# Same ids as the TEMPLATES of basic_itinerary.py and template_to_mongo.js
+TEMPLATE_FILES = {
+    "1": "Doc1.png",
+    "2": "Doc2.png",
+    "3": "Doc3.png",
+}
+
+
+class UnknownTemplate(Exception):
+    """Raised for a template_id that is not in TEMPLATE_FILES."""
+
+
+def check_template_id(template_id):
+    template_id = str(template_id)
+    if template_id not in TEMPLATE_FILES:
+        raise UnknownTemplate(f"Unknown template_id {template_id!r}")
+    return template_id
+
+def render_options():
+    """Settings that change a render's pixels, part of its render_cache key."""
+    return {"font": RENDER_FONT, "font_size": RENDER_FONT_SIZE, "format": "PNG"}
+
+def file_version(path):
+    stat = Path(path).stat()
+    return ("file", stat.st_mtime_ns, stat.st_size)
+
+def encode_png(image):
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+def load_font(name=RENDER_FONT, size=RENDER_FONT_SIZE):
+    return ImageFont.truetype(name, size)
+
+def overlay_text(image, text, font):
+    """Draw itinerary text on a template image in place, one line every 35px from (50, 250)."""
+    draw = ImageDraw.Draw(image)
+    x, y = 50, 250
+    for line in text.split("\n"):
+        draw.text((x, y), line, fill="black", font=font)
+        y += 35
+    return image
+
+def _decode(source):
+    image = Image.open(source)
+    # Decode now rather than on first use, and detach from the file
+    image.load()
+    return image
+
+
+class TemplateCache:
+    """Base template images by id, decoded once and reloaded when their source changes."""
+
+    def __init__(self, template_dir=TEMPLATE_DIR, template_files=TEMPLATE_FILES, source=RENDER_TEMPLATE_SOURCE, check_interval=RENDER_TEMPLATE_CHECK_INTERVAL):
+        self.template_dir = Path(template_dir)
+        self.template_files = dict(template_files)
+        self.source = source
+        self.check_interval = check_interval
+        # template_id -> (version, decoded image)
+        self.images = {}
+        self.checked_at = 0.0
+        self.reloads = 0
+        # _lock guards images and checked_at and is never held during I/O; _refresh_lock lets one thread at a time check and load
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _file_version(self, template_id):
+        return file_version(self.template_dir / self.template_files[template_id])
+
+    def _mongo_versions(self):
+        # Without updatedAt (documents saved before it was added) a change cannot be seen, so the first load is kept
+        docs = database.get_db()[TEMPLATE_COLLECTION].find({"template_id": {"$in": list(self.template_files)}}, {"template_id": 1, "updatedAt": 1})
+        return {doc["template_id"]: ("mongo", doc.get("updatedAt")) for doc in docs}
+
+    def _versions(self):
+        versions = {}
+        if self.source == "mongo":
+            try:
+                versions = self._mongo_versions()
+            except Exception as e:
+                logger.error(f"Could not check templates in MongoDB, using the files: {str(e)}")
+        for template_id in self.template_files:
+            if template_id not in versions:
+                versions[template_id] = self._file_version(template_id)
+        return versions
+
+    def _load(self, template_id, version):
+        if version[0] == "mongo":
+            doc = database.get_db()[TEMPLATE_COLLECTION].find_one({"template_id": template_id}, {"image": 1})
+            return _decode(io.BytesIO(doc["image"]))
+        return _decode(self.template_dir / self.template_files[template_id])
+
+    def _due(self, force):
+        with self._lock:
+            return force or not self.images or time.monotonic() - self.checked_at >= self.check_interval
+
+    def refresh(self, force=False):
+        """Reload templates whose source changed; a no-op within check_interval of the last check.
+
+        The sources are read without holding the lock renders take, and the new
+        images are swapped in afterwards. While one thread refreshes, the others
+        keep using the images they have, unless there are none yet.
+        """
+        if not self._due(force):
+            return
+        if not self._refresh_lock.acquire(blocking=force or not self.images):
+            return
+        try:
+            if not self._due(force):
+                return
+            with self._lock:
+                self.checked_at = time.monotonic()
+                versions_held = {template_id: cached[0] for template_id, cached in self.images.items()}
+
+            loaded = {}
+            for template_id, version in self._versions().items():
+                if versions_held.get(template_id) != version:
+                    loaded[template_id] = (version, self._load(template_id, version))
+
+            with self._lock:
+                self.images.update(loaded)
+            for template_id in loaded:
+                if template_id in versions_held:
+                    self.reloads += 1
+                    logger.info(f"Reloaded itinerary template {template_id}")
+        finally:
+            self._refresh_lock.release()
+
+    def current(self, template_id):
+        """(version, image) of the template renders use now, read together so a reload cannot split them.
+
+        The image is shared between renders: copy it before drawing on it.
+        """
+        template_id = check_template_id(template_id)
+        self.refresh()
+        with self._lock:
+            return self.images[template_id]
+
+    def get(self, template_id):
+        """A copy of the template image, safe for the caller to draw on."""
+        return self.current(template_id)[1].copy()
+
+
+_template_cache = None
+_template_cache_lock = threading.Lock()
+# FreeType faces are not safe to share between threads, so each render thread keeps its own
+_fonts = threading.local()
+
+
+def get_template_cache():
+    global _template_cache
+
+    if _template_cache is None:
+        with _template_cache_lock:
+            if _template_cache is None:
+                _template_cache = TemplateCache()
+    return _template_cache
+
+def get_font(name=RENDER_FONT, size=RENDER_FONT_SIZE):
+    """The font for this thread, loaded once."""
+    cache = getattr(_fonts, "cache", None)
+    if cache is None:
+        cache = _fonts.cache = {}
+    if (name, size) not in cache:
+        cache[(name, size)] = load_font(name, size)
+    return cache[(name, size)]
+
+def preload():
+    """Decode every template up front, so the first render does not pay for it."""
+    get_template_cache().refresh(force=True)
+
+def render_template(text, template):
+    """A copy of a template image from TemplateCache.current with the itinerary text drawn on it."""
+    return overlay_text(template.copy(), text, get_font())
+
+def render_to_file(text, template_path, store=None):
+    """Render onto a template file and save the PNG under its content address; returns the path.
+
+    For the command-line scripts: concurrent runs write different files unless
+    they render the same image.
+    """
+    store = store or render_cache.DiskRenderStore()
+    key = render_cache.render_key(text, os.path.abspath(template_path), file_version(template_path), render_options())
+    path = store.path(key)
+    if not path.exists():
+        path = store.put(key, encode_png(overlay_text(Image.open(template_path), text, load_font())))
+    return str(path)
@@ -0,0 +1,144 @@
+"""Content-addressed cache of rendered itinerary images.
+
+A render is identified by a hash of everything that decides its pixels: the
+itinerary text, the template id and version, and the render options (font,
+size, format). Renders are produced into memory, so concurrent requests never
+share an output file, and the same itinerary on the same template is only
+drawn once. The in-memory tier is an LRU bounded by total image bytes.
+
+With RENDER_CACHE_PERSIST=1 renders are also written to RENDER_CACHE_DIR as
+<hash>.png, which the command-line scripts always do since they return a path.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RENDER_CACHE_PERSIST = os.getenv("RENDER_CACHE_PERSIST", "0") == "1"
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", str(Path(__file__).resolve().parent.parent / ".render_cache"))
+# Oldest files are removed once the directory grows past this
+RENDER_CACHE_DISK_MAX_BYTES = int(os.getenv("RENDER_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def render_key(text, template_id, template_version, options):
+    """sha256 over the render inputs; equal keys mean byte-identical images."""
+    payload = json.dumps([text, str(template_id), template_version, options], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskRenderStore:
+    """Renders as <key>.png files, trimmed to max_bytes oldest first."""
+
+    def __init__(self, directory=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_DISK_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return self.directory / f"{key}.png"
+
+    def get(self, key):
+        try:
+            return self.path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, image):
+        # Write then rename, so readers never see a half-written file
+        path = self.path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(image)
+        os.replace(tmp_path, path)
+        self.prune()
+        return path
+
+    def prune(self):
+        files = []
+        for path in self.directory.glob("*.png"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class RenderCache:
+    """LRU of PNG bytes by render key, bounded by total size, with an optional disk tier."""
+
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_BYTES, store=None):
+        self.max_bytes = max_bytes
+        self.store = store
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _remember(self, key, image):
+        if len(image) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= len(self.entries.pop(key))
+        self.entries[key] = image
+        self.bytes += len(image)
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return image
+
+        image = self.store.get(key) if self.store is not None else None
+        with self._lock:
+            if image is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._remember(key, image)
+        return image
+
+    def put(self, key, image):
+        with self._lock:
+            self._remember(key, image)
+        if self.store is not None:
+            self.store.put(key, image)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None
+            }
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """Process-wide render cache, configured from the RENDER_CACHE_* settings."""
+    global _render_cache
+
+    if _render_cache is None:
+        with _render_cache_lock:
+            if _render_cache is None:
+                _render_cache = RenderCache(store=DiskRenderStore() if RENDER_CACHE_PERSIST else None)
+    return _render_cache
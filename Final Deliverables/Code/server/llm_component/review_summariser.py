@@ -1,11 +1,16 @@
-import pymongo
 from bson import ObjectId
 import os
+import asyncio
 import sys
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+from datetime import datetime
 from pathlib import Path
-from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
+from llm_component import database, llm_clients, prompt_encoding, summary_cache
 
 # Get the absolute path to the root directory (server folder)
 ROOT_DIR = Path(__file__).resolve().parent.parent
@@ -14,17 +19,42 @@ ENV_PATH = ROOT_DIR / "config.env"
 # Load the .env file using absolute path
 load_dotenv(dotenv_path=str(ENV_PATH))
 
-# setup mongodb connection
+# "incremental" folds new reviews into the previous summary, "full" always re-summarises the latest reviews
+REVIEW_SUMMARY_MODE = os.getenv("REVIEW_SUMMARY_MODE", "incremental").lower()
+# Larger backlogs of new reviews are summarised from scratch instead of folded in
+REVIEW_SUMMARY_DELTA_LIMIT = int(os.getenv("REVIEW_SUMMARY_DELTA_LIMIT", "20"))
+# Re-summarise from scratch after this many folds so the summary does not drift
+REVIEW_SUMMARY_MAX_FOLDS = int(os.getenv("REVIEW_SUMMARY_MAX_FOLDS", "10"))
+
+# "latest" summarises the newest 20 reviews, "all" map-reduces over the entity's whole review history
+REVIEW_SUMMARY_HISTORY = os.getenv("REVIEW_SUMMARY_HISTORY", "latest").lower()
+# Map-reduce knobs: prompt budget per chunk (estimated tokens), LLM calls in flight, partials per reduce call
+REVIEW_SUMMARY_CHUNK_TOKENS = int(os.getenv("REVIEW_SUMMARY_CHUNK_TOKENS", "3000"))
+REVIEW_SUMMARY_MAX_WORKERS = int(os.getenv("REVIEW_SUMMARY_MAX_WORKERS", "4"))
+REVIEW_SUMMARY_REDUCE_FANIN = int(os.getenv("REVIEW_SUMMARY_REDUCE_FANIN", "8"))
+# Wall-clock budget for the map phase (seconds); chunks not summarised in time are left out
+REVIEW_SUMMARY_TIME_BUDGET = float(os.getenv("REVIEW_SUMMARY_TIME_BUDGET", "20"))
+# Upper bound on reviews read per entity, 0 for no limit
+REVIEW_SUMMARY_MAX_REVIEWS = int(os.getenv("REVIEW_SUMMARY_MAX_REVIEWS", "0"))
+
+# Batch endpoint: most IDs per request, and entities summarised concurrently (separate pool from map-reduce)
+SUMMARY_BATCH_MAX_IDS = int(os.getenv("SUMMARY_BATCH_MAX_IDS", "100"))
+SUMMARY_BATCH_MAX_WORKERS = int(os.getenv("SUMMARY_BATCH_MAX_WORKERS", "8"))
+
+REVIEW_FIELDS = {"rating": 1, "title": 1, "reviewContent": 1, "createdAt": 1}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_batch_executor = None
+_executor_lock = threading.Lock()
+
+# Optional throttle for every LLM call, e.g. installed by summary_batch.py to respect Groq rate limits
+llm_rate_limiter = None
+
+# setup mongodb connection (shared, pooled client)
 def connect_to_db():
-    mongo_uri = os.getenv("MONGODB_URI_REMOTE")
-    if not mongo_uri:
-        print("WARNING: MONGODB_URI_REMOTE environment variable not found!")
-    
-    db_client = pymongo.MongoClient(mongo_uri)
-    # print(f"MongoDB URI: {mongo_uri}")
-    # print(f"GROQ API Key exists: {'Yes' if os.getenv('GROQ_API_KEY') else 'No'}")
-    db = db_client['OdysseumDatabase']
-    return db
+    return database.get_db()
 
 #get latest 20 reviews
 def get_reviews_by_business(business_id):
@@ -39,29 +69,85 @@ def get_reviews_by_location(location_id):
     reviews = list(collection.find({"entityId": ObjectId(location_id)}).sort([("createdAt", -1)]).limit(20))
     return reviews
 
+# latest 20 reviews on the async client, for llm_asgi.py
+async def aget_latest_reviews(entity_id):
+    db = database.get_async_db()
+    cursor = db['Review'].find({"entityId": ObjectId(entity_id)}).sort([("createdAt", -1)]).limit(20)
+    return await cursor.to_list()
+
+# reviews written after a summary was built, up to the watermark it is being refreshed to
+def get_new_reviews(entity_id, covered_until, covered_ids, watermark):
+    db = connect_to_db()
+    collection = db['Review']
+    created_at = {"$gte": datetime.fromisoformat(covered_until)}
+    if watermark and watermark[1]:
+        created_at["$lte"] = datetime.fromisoformat(watermark[1])
+    reviews = collection.find({"entityId": ObjectId(entity_id), "createdAt": created_at}).sort([("createdAt", 1)])
+    covered_ids = set(covered_ids)
+    return [review for review in reviews if str(review["_id"]) not in covered_ids]
+
+# latest reviews of many entities in one aggregation, plus each entity's watermark
+def get_latest_reviews_for_entities(entity_ids, limit=20):
+    db = connect_to_db()
+    pipeline = [
+        {"$match": {"entityId": {"$in": [ObjectId(entity_id) for entity_id in entity_ids]}}},
+        {"$sort": {"entityId": 1, "createdAt": -1, "_id": -1}},
+        {"$group": {"_id": "$entityId", "reviews": {"$firstN": {"input": "$$ROOT", "n": limit}}}}
+    ]
+    latest = {str(entity_id): ([], None) for entity_id in entity_ids}
+    for doc in db['Review'].aggregate(pipeline, allowDiskUse=True):
+        reviews = doc["reviews"]
+        newest = reviews[0]
+        created_at = newest.get("createdAt")
+        # Same shape as summary_cache.get_review_watermark
+        latest[str(doc["_id"])] = (reviews, (str(newest["_id"]), created_at.isoformat() if created_at else None))
+    return latest
+
+# stream every review of an entity, newest first, in chunks that fit the prompt budget
+def iter_review_chunks(entity_id, chunk_tokens=None, max_reviews=None):
+    chunk_tokens = chunk_tokens or REVIEW_SUMMARY_CHUNK_TOKENS
+    max_reviews = REVIEW_SUMMARY_MAX_REVIEWS if max_reviews is None else max_reviews
+
+    db = connect_to_db()
+    cursor = db['Review'].find({"entityId": ObjectId(entity_id)}, REVIEW_FIELDS).sort([("createdAt", -1)]).batch_size(500)
+    if max_reviews:
+        cursor = cursor.limit(max_reviews)
+
+    chunk, tokens = [], 0
+    for review in cursor:
+        review_tokens = prompt_encoding.estimate_tokens(format_reviews([review]))
+        if chunk and tokens + review_tokens > chunk_tokens:
+            yield chunk
+            chunk, tokens = [], 0
+        chunk.append(review)
+        tokens += review_tokens
+    if chunk:
+        yield chunk
+
 
 def initialize_llm_client():
-    # api_key = get_langchain_api_key()
-    # chat_groq = ChatGroq(api_key)
+    # Shared across calls so the Groq connection pool is reused
     model_name="llama-3.1-8b-instant"
-    llm_client = ChatGroq(model=model_name)
-    return llm_client
+    return llm_clients.get_groq_chat(model_name)
 
-def summarise_reviews(reviews):
-    llm_client = initialize_llm_client()
-    
+def format_reviews(reviews):
     review_texts = []
     for review in reviews:
         # Format each review with relevant information
         review_text = f"Rating: {review.get('rating', 'N/A')}/5, Title: {review.get('title', 'N/A')}, Content: {review.get('reviewContent', 'N/A')}"
-        # print(review_text)
         review_texts.append(review_text)
     
     # Join all review texts
-    all_reviews = "\n\n".join(review_texts)
+    return "\n\n".join(review_texts)
+
+def invoke_chain(chain, inputs):
+    if llm_rate_limiter is not None:
+        llm_rate_limiter.acquire()
+    return chain.invoke(inputs)
+
+def build_summary_chain():
+    llm_client = initialize_llm_client()
 
-    # print(all_reviews)
-    
     # # Create a proper prompt template with input variables
     prompt_template = PromptTemplate(
         input_variables=["reviews"],
@@ -79,24 +165,326 @@ def summarise_reviews(reviews):
         DO NOT add any extra information. Only the summary is required.
         """
     )
-    
+
+    return prompt_template | llm_client
+
+def summarise_reviews(reviews):
+    all_reviews = format_reviews(reviews)
+
     # Invoke the LLM with the reviews
-    chain = prompt_template | llm_client
-    summary = chain.invoke({"reviews": all_reviews})
+    chain = build_summary_chain()
+    summary = invoke_chain(chain, {"reviews": all_reviews})
     
     return summary.content
 
+async def asummarise_reviews(reviews):
+    chain = build_summary_chain()
+    summary = await chain.ainvoke({"reviews": format_reviews(reviews)})
+    return summary.content
 
-def run_summariser_business(business_id):
-    reviews = get_reviews_by_business(business_id)
-    summary = summarise_reviews(reviews)
+# same as summarise_reviews, but yields the summary token by token as the LLM produces it
+def stream_summarise_reviews(reviews):
+    chain = build_summary_chain()
+    if llm_rate_limiter is not None:
+        llm_rate_limiter.acquire()
+    for chunk in chain.stream({"reviews": format_reviews(reviews)}):
+        if chunk.content:
+            yield chunk.content
+
+def fold_reviews_into_summary(previous_summary, new_reviews):
+    llm_client = initialize_llm_client()
+
+    prompt_template = PromptTemplate(
+        input_variables=["summary", "reviews"],
+        template="""\
+        You are an expert summariser of user reviews for businesses and tourist destinations.
+        You are given an existing summary of the reviews of a business or tourist destination, and some reviews that were written after it.
+        Update the summary so it also reflects the new reviews. Keep what still holds, adjust the overall sentiment if the new reviews shift it, and include any interesting new opinion in a way that reflects the overall sentiment.
+
+        Input:
+        Existing summary: {summary}
+        New reviews: {reviews}
+
+        Output:
+        A maximum of 6-7 lines paragraph summarising all the reviews and user sentiments towards the business or destination.
+
+        DO NOT add any extra information. Only the updated summary is required.
+        """
+    )
+
+    chain = prompt_template | llm_client
+    summary = invoke_chain(chain, {"summary": previous_summary, "reviews": format_reviews(new_reviews)})
+
+    return summary.content
+
+def combine_summaries(partial_summaries):
+    llm_client = initialize_llm_client()
+
+    prompt_template = PromptTemplate(
+        input_variables=["summaries"],
+        template="""\
+        You are an expert summariser of user reviews for businesses and tourist destinations.
+        The reviews of a business or tourist destination were split into groups and each group was summarised separately. Combine these partial summaries into one summary.
+        Weigh each partial summary equally, keep the overall sentiment of the users, and keep any interesting opinion that stands out.
+
+        Input:
+        Partial summaries, newest reviews first: {summaries}
+
+        Output:
+        A maximum of 6-7 lines paragraph summarising the reviews and user sentiments towards the business or destination.
+
+        DO NOT add any extra information. Only the summary is required.
+        """
+    )
+
+    chain = prompt_template | llm_client
+    summary = invoke_chain(chain, {"summaries": "\n\n".join(f"- {partial}" for partial in partial_summaries)})
+
+    return summary.content
+
+def get_executor():
+    # One bounded pool per process caps concurrent LLM calls across all requests
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=REVIEW_SUMMARY_MAX_WORKERS, thread_name_prefix="review-summary")
+        return _executor
+
+def get_batch_executor():
+    global _batch_executor
+    with _executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(max_workers=SUMMARY_BATCH_MAX_WORKERS, thread_name_prefix="summary-batch")
+        return _batch_executor
+
+def reduce_summaries(partial_summaries, executor):
+    while len(partial_summaries) > 1:
+        groups = [partial_summaries[i:i + REVIEW_SUMMARY_REDUCE_FANIN] for i in range(0, len(partial_summaries), REVIEW_SUMMARY_REDUCE_FANIN)]
+        futures = [executor.submit(combine_summaries, group) if len(group) > 1 else None for group in groups]
+        partial_summaries = [future.result() if future else group[0] for future, group in zip(futures, groups)]
+    return partial_summaries[0]
+
+def summarise_all_reviews(entity_id, time_budget=None):
+    """Map-reduce summary over an entity's whole review history.
+
+    Returns the summary, the reviews it covers and whether it covers all of
+    them. Chunks are summarised concurrently on the shared pool and built
+    newest first. The newest chunk is always waited for; older chunks not done
+    within the time budget are dropped.
+    """
+    executor = get_executor()
+    deadline = time.monotonic() + (REVIEW_SUMMARY_TIME_BUDGET if time_budget is None else time_budget)
+    # Keep only a couple of chunks per worker queued so a huge history is not read into memory at once
+    in_flight = threading.BoundedSemaphore(REVIEW_SUMMARY_MAX_WORKERS * 2)
+
+    submitted = []
+    read_all = True
+    for chunk in iter_review_chunks(entity_id):
+        if not in_flight.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            read_all = False
+            break
+        future = executor.submit(summarise_reviews, chunk)
+        future.add_done_callback(lambda _: in_flight.release())
+        submitted.append((future, chunk))
+
+    if not submitted:
+        return summarise_reviews([]), [], read_all
+
+    done, not_done = wait([future for future, _ in submitted], timeout=max(deadline - time.monotonic(), 0))
+    newest_future, newest_chunk = submitted[0]
+    for future in not_done:
+        if future is not newest_future:
+            future.cancel()
+
+    # The summary must reflect the latest reviews, so the newest chunk is waited for past the budget
+    completed = [(newest_future.result(), newest_chunk)]
+    completed += [(future.result(), chunk) for future, chunk in submitted[1:] if future in done and future.exception() is None]
+    complete = read_all and len(completed) == len(submitted)
+    if not complete:
+        logger.warning(f"Summary of {entity_id} used {len(completed)} of {len(submitted)} chunks within the time budget")
+
+    summary = reduce_summaries([partial for partial, _ in completed], executor)
+    return summary, [review for _, chunk in completed for review in chunk], complete
+
+def coverage_of(reviews):
+    # What a summary built from these reviews covers, stored next to it in the cache
+    review_ids = [str(review["_id"]) for review in reviews]
+    timestamps = [review["createdAt"] for review in reviews if review.get("createdAt")]
+    return {"review_ids": review_ids, "covered_until": max(timestamps).isoformat() if timestamps else None}
+
+def can_fold(entry):
+    return bool(entry and entry.get("covered_until")) and entry.get("folds", 0) < REVIEW_SUMMARY_MAX_FOLDS
+
+def run_incremental_summariser(entity_id, watermark, cache):
+    # Fold only the reviews written since the last summary into it; None when a full run is needed
+    entry = cache.get_entry(entity_id)
+    if not can_fold(entry):
+        return None
+
+    new_reviews = get_new_reviews(entity_id, entry["covered_until"], entry.get("review_ids", []), watermark)
+    # Nothing new means older reviews were deleted; too many means a fresh summary is cheaper
+    if not new_reviews or len(new_reviews) > REVIEW_SUMMARY_DELTA_LIMIT:
+        return None
+
+    summary = fold_reviews_into_summary(entry["summary"], new_reviews)
+    coverage = coverage_of(new_reviews)
+    cache.put(entity_id, watermark, summary,
+              review_ids=entry.get("review_ids", []) + coverage["review_ids"],
+              covered_until=max(entry["covered_until"], coverage["covered_until"] or entry["covered_until"]),
+              folds=entry.get("folds", 0) + 1)
     return summary
 
-def run_summariser_location(location_id):
-    reviews = get_reviews_by_location(location_id)
-    summary = summarise_reviews(reviews)
+def run_cached_summariser(entity_id, get_reviews, cache=None, watermark=None):
+    # Reuse the last summary until a review newer than the one it was built from shows up
+    if cache is None:
+        cache = summary_cache.get_summary_cache()
+    if watermark is None:
+        watermark = summary_cache.get_review_watermark(ObjectId(entity_id))
+    summary = cache.get(entity_id, watermark)
+    if summary is not None:
+        return summary
+
+    if REVIEW_SUMMARY_MODE == "incremental":
+        summary = run_incremental_summariser(entity_id, watermark, cache)
+        if summary is not None:
+            return summary
+
+    complete = True
+    if REVIEW_SUMMARY_HISTORY == "all":
+        summary, reviews, complete = summarise_all_reviews(entity_id)
+    else:
+        reviews = get_reviews(entity_id)
+        summary = summarise_reviews(reviews)
+    # A summary that ran out of time is served but not cached, so the next request builds a full one
+    if complete:
+        cache.put(entity_id, watermark, summary, folds=0, **coverage_of(reviews))
+    return summary
+
+async def _cache_call(cache, method, *args, **kwargs):
+    # Only a persistent store makes cache calls block on I/O
+    if cache.store is None:
+        return method(*args, **kwargs)
+    return await asyncio.to_thread(method, *args, **kwargs)
+
+async def arun_cached_summariser(entity_id, aget_reviews, cache=None):
+    """run_cached_summariser for the async server: a fresh summary of the latest reviews never leaves the event loop."""
+    if cache is None:
+        cache = summary_cache.get_summary_cache()
+    watermark = await summary_cache.aget_review_watermark(ObjectId(entity_id))
+    summary = await _cache_call(cache, cache.get, entity_id, watermark)
+    if summary is not None:
+        return summary
+
+    # Folds and map-reduce are thread-pool code, so they run off the event loop
+    if REVIEW_SUMMARY_MODE == "incremental" and can_fold(await _cache_call(cache, cache.get_entry, entity_id)):
+        summary = await asyncio.to_thread(run_incremental_summariser, entity_id, watermark, cache)
+        if summary is not None:
+            return summary
+
+    complete = True
+    if REVIEW_SUMMARY_HISTORY == "all":
+        summary, reviews, complete = await asyncio.to_thread(summarise_all_reviews, entity_id)
+    else:
+        reviews = await aget_reviews(entity_id)
+        summary = await asummarise_reviews(reviews)
+    if complete:
+        await _cache_call(cache, cache.put, entity_id, watermark, summary, folds=0, **coverage_of(reviews))
     return summary
 
+def stream_cached_summariser(entity_id, get_reviews, cache=None):
+    """Yield the summary in pieces: token by token when it is freshly generated, in one piece otherwise."""
+    if cache is None:
+        cache = summary_cache.get_summary_cache()
+    watermark = summary_cache.get_review_watermark(ObjectId(entity_id))
+    summary = cache.get(entity_id, watermark)
+    if summary is not None:
+        yield summary
+        return
+
+    # Folds and map-reduce have no single prompt to stream, so they send the finished summary
+    if REVIEW_SUMMARY_MODE == "incremental":
+        summary = run_incremental_summariser(entity_id, watermark, cache)
+        if summary is not None:
+            yield summary
+            return
+
+    if REVIEW_SUMMARY_HISTORY == "all":
+        summary, reviews, complete = summarise_all_reviews(entity_id)
+        if complete:
+            cache.put(entity_id, watermark, summary, folds=0, **coverage_of(reviews))
+        yield summary
+        return
+
+    reviews = get_reviews(entity_id)
+    pieces = []
+    for piece in stream_summarise_reviews(reviews):
+        pieces.append(piece)
+        yield piece
+    # Only a summary that streamed to the end is cached
+    cache.put(entity_id, watermark, "".join(pieces), folds=0, **coverage_of(reviews))
+
+def run_summariser_business(business_id):
+    return run_cached_summariser(business_id, get_reviews_by_business)
+
+def run_summariser_location(location_id):
+    return run_cached_summariser(location_id, get_reviews_by_location)
+
+async def arun_summariser_business(business_id):
+    return await arun_cached_summariser(business_id, aget_latest_reviews)
+
+async def arun_summariser_location(location_id):
+    return await arun_cached_summariser(location_id, aget_latest_reviews)
+
+def stream_summariser_business(business_id):
+    return stream_cached_summariser(business_id, get_reviews_by_business)
+
+def stream_summariser_location(location_id):
+    return stream_cached_summariser(location_id, get_reviews_by_location)
+
+def iter_summariser_batch(entity_ids):
+    """Yield (entity_id, summary, error) for many entities, cached ones first, the rest as the LLM finishes them."""
+    cache = summary_cache.get_summary_cache()
+    unique_ids = list(dict.fromkeys(entity_ids))
+    valid_ids = [entity_id for entity_id in unique_ids if ObjectId.is_valid(entity_id)]
+    for entity_id in unique_ids:
+        if not ObjectId.is_valid(entity_id):
+            yield entity_id, None, "invalid id"
+
+    # One round trip for every entity's latest reviews and watermark
+    latest = get_latest_reviews_for_entities(valid_ids) if valid_ids else {}
+
+    misses = []
+    for entity_id in valid_ids:
+        reviews, watermark = latest[entity_id]
+        summary = cache.get(entity_id, watermark)
+        if summary is not None:
+            yield entity_id, summary, None
+        else:
+            misses.append(entity_id)
+
+    executor = get_batch_executor()
+    futures = {}
+    for entity_id in misses:
+        reviews, watermark = latest[entity_id]
+        # The prefetched reviews stand in for the per-entity query
+        get_reviews = lambda _, reviews=reviews: reviews
+        futures[executor.submit(run_cached_summariser, entity_id, get_reviews, cache, watermark)] = entity_id
+
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result(), None
+        except Exception as e:
+            yield futures[future], None, str(e)
+
+def run_summariser_batch(entity_ids):
+    summaries, errors = {}, {}
+    for entity_id, summary, error in iter_summariser_batch(entity_ids):
+        if error is None:
+            summaries[entity_id] = summary
+        else:
+            errors[entity_id] = error
+    return summaries, errors
+
 
 # businessid = '67ccc753451d0a11fb7c307a'
 
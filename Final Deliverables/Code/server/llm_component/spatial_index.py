@@ -0,0 +1,125 @@
+import math
+import threading
+
+# Below this many locations a plain scan beats walking grid cells
+LINEAR_SCAN_THRESHOLD = 24
+
+
+class LocationGridIndex:
+    """Uniform grid over location coordinates for exact nearest-location lookups.
+
+    Distances are the same planar Euclidean distance on [longitude, latitude]
+    pairs used by ItineraryProcessor.calculate_distance, and ties go to the
+    location that comes first in locations_data, so results match a linear scan.
+    """
+
+    def __init__(self, locations_data):
+        self.points = []
+        for order, (loc_name, coords) in enumerate(locations_data.items()):
+            point = _as_point(coords)
+            if point is not None:
+                self.points.append((loc_name.strip("[]"), point[0], point[1], order))
+
+        self.cells = {}
+        if not self.points:
+            self.cell_size = 1.0
+            return
+
+        xs = [p[1] for p in self.points]
+        ys = [p[2] for p in self.points]
+        self.min_x, self.min_y = min(xs), min(ys)
+
+        # Aim for roughly one location per cell, without degenerating when locations lie on a line
+        width, height = max(xs) - self.min_x, max(ys) - self.min_y
+        count = len(self.points)
+        self.cell_size = max(math.sqrt(width * height / count), max(width, height) / count, 1e-6)
+
+        for point in self.points:
+            self.cells.setdefault(self._cell_of(point[1], point[2]), []).append(point)
+
+        cell_xs = [cell[0] for cell in self.cells]
+        cell_ys = [cell[1] for cell in self.cells]
+        self.cell_bounds = (min(cell_xs), max(cell_xs), min(cell_ys), max(cell_ys))
+
+    def _cell_of(self, x, y):
+        return (math.floor((x - self.min_x) / self.cell_size), math.floor((y - self.min_y) / self.cell_size))
+
+    def nearest(self, coords):
+        """Return the name of the closest location to coords, or None."""
+        point = _as_point(coords)
+        if point is None or not self.points:
+            return None
+
+        x, y = point
+        if len(self.points) <= LINEAR_SCAN_THRESHOLD:
+            return min((((x - px) ** 2 + (y - py) ** 2) ** 0.5, order, name) for name, px, py, order in self.points)[2]
+
+        cx, cy = self._cell_of(x, y)
+        min_cx, max_cx, min_cy, max_cy = self.cell_bounds
+
+        # Rings closer than this cannot contain any location
+        start = max(min_cx - cx, cx - max_cx, min_cy - cy, cy - max_cy, 0)
+        end = max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy)
+
+        best = None
+        for ring in range(start, end + 1):
+            # Locations in this ring or beyond are more than (ring - 1) cells away
+            if best is not None and best[0] < (ring - 1) * self.cell_size:
+                break
+            for cell in _ring_cells(cx, cy, ring, self.cell_bounds):
+                for name, px, py, order in self.cells.get(cell, ()):
+                    candidate = (((x - px) ** 2 + (y - py) ** 2) ** 0.5, order, name)
+                    if best is None or candidate < best:
+                        best = candidate
+
+        return best[2] if best is not None else None
+
+    def nearest_many(self, coords_list):
+        """Batched nearest-location lookup, one result per input."""
+        return [self.nearest(coords) for coords in coords_list]
+
+
+def _as_point(coords):
+    if not coords:
+        return None
+    try:
+        return (float(coords[0]), float(coords[1]))
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def _ring_cells(cx, cy, ring, bounds):
+    min_cx, max_cx, min_cy, max_cy = bounds
+    if ring == 0:
+        yield (cx, cy)
+        return
+
+    x_lo, x_hi = max(cx - ring, min_cx), min(cx + ring, max_cx)
+    y_lo, y_hi = max(cy - ring + 1, min_cy), min(cy + ring - 1, max_cy)
+
+    # Top and bottom rows of the ring
+    for gy in (cy - ring, cy + ring):
+        if min_cy <= gy <= max_cy:
+            for gx in range(x_lo, x_hi + 1):
+                yield (gx, gy)
+
+    # Left and right columns, without the corners already visited
+    for gx in (cx - ring, cx + ring):
+        if min_cx <= gx <= max_cx:
+            for gy in range(y_lo, y_hi + 1):
+                yield (gx, gy)
+
+
+_cached_index = None
+_cached_version = None
+_cache_lock = threading.Lock()
+
+
+def get_location_index(snapshot):
+    """Return the index for a catalog snapshot, building it once per catalog version."""
+    global _cached_index, _cached_version
+
+    with _cache_lock:
+        if _cached_version != snapshot.version or _cached_index is None:
+            _cached_index = LocationGridIndex(snapshot.locations_data)
+            _cached_version = snapshot.version
+        return _cached_index
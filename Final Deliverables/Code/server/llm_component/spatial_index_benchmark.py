@@ -0,0 +1,57 @@
+"""Benchmark business-to-location assignment: linear scan vs. LocationGridIndex.
+
+Run from the server folder:
+    python -m llm_component.spatial_index_benchmark
+    python -m llm_component.spatial_index_benchmark --locations 50 200 800 --businesses 1000 10000 40000
+"""
+import argparse
+import random
+import time
+from llm_component import spatial_index
+from llm_component.ItineraryProcessor import find_closest_location
+
+# Rough bounding box of northern Pakistan, [longitude, latitude]
+LON_RANGE = (70.0, 77.0)
+LAT_RANGE = (32.0, 37.0)
+
+
+def random_coords(rng, count):
+    return [[rng.uniform(*LON_RANGE), rng.uniform(*LAT_RANGE)] for _ in range(count)]
+
+def linear_assignment(locations_data, business_coords):
+    location_coords = {loc_name.strip("[]"): coords for loc_name, coords in locations_data.items()}
+    return [find_closest_location(coords, location_coords) for coords in business_coords]
+
+def indexed_assignment(locations_data, business_coords):
+    index = spatial_index.LocationGridIndex(locations_data)
+    return index.nearest_many(business_coords)
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, nargs="+", default=[25, 100, 400])
+    parser.add_argument("--businesses", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'locations':>10} {'businesses':>11} {'linear (s)':>11} {'index (s)':>10} {'speedup':>8}  match")
+
+    for location_count in args.locations:
+        locations_data = {f"[Location {i}]": coords for i, coords in enumerate(random_coords(rng, location_count))}
+        for business_count in args.businesses:
+            business_coords = random_coords(rng, business_count)
+
+            expected, linear_time = time_call(linear_assignment, locations_data, business_coords)
+            actual, index_time = time_call(indexed_assignment, locations_data, business_coords)
+
+            speedup = linear_time / index_time if index_time else float("inf")
+            print(f"{location_count:>10} {business_count:>11} {linear_time:>11.3f} {index_time:>10.3f} {speedup:>7.1f}x  {expected == actual}")
+
+
+if __name__ == "__main__":
+    main()
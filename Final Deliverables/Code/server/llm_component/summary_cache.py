@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import pymongo
+from llm_component import database
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "2000"))
+SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "86400"))
+# Optional persistent tier behind the in-memory LRU: "none", "mongo" or "disk"
+SUMMARY_CACHE_PERSISTENCE = os.getenv("SUMMARY_CACHE_PERSISTENCE", "none").lower()
+SUMMARY_CACHE_DIR = os.getenv("SUMMARY_CACHE_DIR", str(Path(__file__).resolve().parent.parent / ".summary_cache"))
+SUMMARY_COLLECTION = "ReviewSummary"
+
+WATERMARK_SORT = [("createdAt", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]
+
+
+def get_review_watermark(entity_id, db=None):
+    """Return (_id, createdAt) of the newest review for an entity, or None if it has no reviews."""
+    if db is None:
+        db = database.get_db()
+
+    latest = db["Review"].find_one({"entityId": entity_id}, {"_id": 1, "createdAt": 1}, sort=WATERMARK_SORT)
+    return _watermark_of(latest)
+
+async def aget_review_watermark(entity_id, db=None):
+    """get_review_watermark on the async MongoDB client."""
+    if db is None:
+        db = database.get_async_db()
+
+    latest = await db["Review"].find_one({"entityId": entity_id}, {"_id": 1, "createdAt": 1}, sort=WATERMARK_SORT)
+    return _watermark_of(latest)
+
+def _watermark_of(latest):
+    if latest is None:
+        return None
+    created_at = latest.get("createdAt")
+    return (str(latest["_id"]), created_at.isoformat() if created_at else None)
+
+def is_fresh_entry(entry, watermark, ttl_seconds=SUMMARY_CACHE_TTL_SECONDS):
+    """True if entry was built from the reviews up to watermark and is younger than ttl_seconds (0 = no expiry)."""
+    if entry is None or entry.get("watermark") != (list(watermark) if watermark else None):
+        return False
+    return ttl_seconds <= 0 or time.time() - entry.get("created_at", 0) < ttl_seconds
+
+def ensure_review_indexes(db=None):
+    """Index that keeps the watermark and latest-N review queries cheap."""
+    if db is None:
+        db = database.get_db()
+    return db["Review"].create_index([("entityId", pymongo.ASCENDING), ("createdAt", pymongo.DESCENDING)])
+
+
+class MongoSummaryStore:
+    """Persistent tier backed by a MongoDB collection, shared by every worker."""
+
+    def __init__(self, collection_name=SUMMARY_COLLECTION):
+        self.collection_name = collection_name
+
+    def _collection(self):
+        return database.get_db()[self.collection_name]
+
+    def get(self, entity_id):
+        return self._collection().find_one({"_id": str(entity_id)}, {"_id": 0})
+
+    def get_many(self, entity_ids):
+        """entity_id -> entry for the ids that have one, in a single query."""
+        docs = self._collection().find({"_id": {"$in": [str(entity_id) for entity_id in entity_ids]}}, {"_id": 0})
+        return {doc["entity_id"]: doc for doc in docs}
+
+    def put(self, entry):
+        self._collection().replace_one({"_id": entry["entity_id"]}, entry, upsert=True)
+
+    def delete(self, entity_id):
+        self._collection().delete_one({"_id": str(entity_id)})
+
+
+class DiskSummaryStore:
+    """Persistent tier that keeps one JSON file per entity."""
+
+    def __init__(self, directory=SUMMARY_CACHE_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, entity_id):
+        return self.directory / f"{entity_id}.json"
+
+    def get(self, entity_id):
+        try:
+            with open(self._path(entity_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def get_many(self, entity_ids):
+        entries = {str(entity_id): self.get(entity_id) for entity_id in entity_ids}
+        return {entity_id: entry for entity_id, entry in entries.items() if entry is not None}
+
+    def put(self, entry):
+        # Write then rename, so readers never see a half-written file
+        path = self._path(entry["entity_id"])
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, entity_id):
+        self._path(entity_id).unlink(missing_ok=True)
+
+
+class SummaryCache:
+    """LRU + TTL cache of review summaries, valid only while no newer review exists."""
+
+    def __init__(self, max_entries=SUMMARY_CACHE_MAX_ENTRIES, ttl_seconds=SUMMARY_CACHE_TTL_SECONDS, store=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, entry, watermark):
+        return is_fresh_entry(entry, watermark, self.ttl_seconds)
+
+    def get(self, entity_id, watermark):
+        """Return the cached summary if it was built from the reviews up to watermark, else None."""
+        entity_id = str(entity_id)
+        with self._lock:
+            entry = self.entries.get(entity_id)
+            if self._is_fresh(entry, watermark):
+                self.entries.move_to_end(entity_id)
+                self.hits += 1
+                return entry["summary"]
+
+        if self.store is not None:
+            try:
+                entry = self.store.get(entity_id)
+            except Exception as e:
+                logger.warning(f"Summary store read failed for {entity_id}: {str(e)}")
+                entry = None
+            if self._is_fresh(entry, watermark):
+                self._remember(entry)
+                with self._lock:
+                    self.hits += 1
+                return entry["summary"]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_entry(self, entity_id):
+        """Return the raw cached entry regardless of freshness, or None."""
+        entity_id = str(entity_id)
+        with self._lock:
+            entry = self.entries.get(entity_id)
+        if entry is None and self.store is not None:
+            entry = self.store.get(entity_id)
+        return entry
+
+    def put(self, entity_id, watermark, summary, **extra):
+        entry = {
+            "entity_id": str(entity_id),
+            "summary": summary,
+            "watermark": list(watermark) if watermark else None,
+            "created_at": time.time(),
+            **extra
+        }
+        self._remember(entry)
+        if self.store is not None:
+            try:
+                self.store.put(entry)
+            except Exception as e:
+                logger.warning(f"Summary store write failed for {entity_id}: {str(e)}")
+        return entry
+
+    def _remember(self, entry):
+        with self._lock:
+            self.entries[entry["entity_id"]] = entry
+            self.entries.move_to_end(entry["entity_id"])
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, entity_id):
+        entity_id = str(entity_id)
+        with self._lock:
+            self.entries.pop(entity_id, None)
+        if self.store is not None:
+            self.store.delete(entity_id)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def create_summary_store(persistence=SUMMARY_CACHE_PERSISTENCE):
+    if persistence == "mongo":
+        return MongoSummaryStore()
+    if persistence == "disk":
+        return DiskSummaryStore()
+    return None
+
+
+_summary_cache = None
+_summary_cache_lock = threading.Lock()
+
+
+def get_summary_cache():
+    """Process-wide summary cache, configured from the SUMMARY_CACHE_* settings."""
+    global _summary_cache
+
+    if _summary_cache is None:
+        with _summary_cache_lock:
+            if _summary_cache is None:
+                _summary_cache = SummaryCache(store=create_summary_store())
+    return _summary_cache
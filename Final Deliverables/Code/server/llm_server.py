@@ -1,7 +1,8 @@
-from flask import Flask, request, jsonify, Blueprint
+from flask import Flask, request, jsonify, Blueprint, Response, stream_with_context
 # from waitress import serve
+import atexit
 import logging
-from llm_component import review_summariser, ItineraryProcessor, ItineraryAiProcessor
+from llm_component import api, review_summariser, ItineraryProcessor, ItineraryAiProcessor, catalog, itinerary_jobs, itinerary_renderer
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -23,15 +24,32 @@ app.logger.setLevel(logging.INFO)
 # Create a logger for the application
 logger = logging.getLogger('flask.app')
 
+# Indexes and itinerary templates; the route handling itself is shared with llm_asgi.py through llm_component/api.py
+api.prepare_process()
+
+atexit.register(api.shutdown_process)
+
+# The catalog refresher thread is started by the first request, not at import: under gunicorn --preload
+# the import runs in the master process and the thread would not be carried into the forked workers
+@app.before_request
+def start_catalog_refresher():
+    catalog.start_catalog_refresher()
+
 # Create a Blueprint for the /api/llm/ prefix
-llm_bp = Blueprint('llm', __name__, url_prefix='/api/llm')
+llm_bp = Blueprint('llm', __name__, url_prefix=api.URL_PREFIX)
+
+def error_response(e, route):
+    body, status, headers = api.error_response(e, route)
+    return jsonify(body), status, headers
+
+def sse_response(events, route):
+    return Response(stream_with_context(api.sse_stream(events, route)), mimetype=api.SSE_MIMETYPE, headers=api.SSE_HEADERS)
 
 # Home route
 @llm_bp.route('/summary/')
 def home():
     app.logger.info('Home page requested')
-    review_summariser.connect_to_db()
-    return jsonify({'message': 'Welcome to the LLM API!'})
+    return jsonify(api.home_body())
 
 # Route to handle business summary
 @llm_bp.route('/summary/businessSummary')
@@ -40,20 +58,12 @@ def businessSummary():
         # Log the incoming request
         app.logger.info('Received request to /businessSummary')
 
-        # Get businessId from the request JSON
-        business_id = request.args.get('businessId')
-        
-        if not business_id:
-            app.logger.warning('businessId is missing in the request')
-            return jsonify({'error': 'businessId is required'}), 400
-        
+        business_id = api.required_arg(request.args, 'businessId')
         summary = review_summariser.run_summariser_business(business_id)
-
         return jsonify({'summary': summary})
 
     except Exception as e:
-        app.logger.error(f"Error in /businessSummary route: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e, '/businessSummary')
 
 
 # Route to handle location summary
@@ -63,54 +73,135 @@ def locationSummary():
         # Log the incoming request
         app.logger.info('Received request to /locationSummary')
 
-        # Get locationId from the request JSON
-        location_id = request.args.get('locationId')
-        
-        if not location_id:
-            app.logger.warning('locationId is missing in the request')
-            return jsonify({'error': 'locationId is required'}), 400
-        
-        # Call function to summarize location (you'll need to implement this logic)
+        location_id = api.required_arg(request.args, 'locationId')
         summary = review_summariser.run_summariser_location(location_id)
-
         return jsonify({'summary': summary})
 
     except Exception as e:
-        app.logger.error(f"Error in /locationSummary route: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e, '/locationSummary')
+
+
+# Streaming variants: the summary arrives as Server-Sent Events, token by token when it is generated
+@llm_bp.route('/summary/businessSummary/stream')
+def businessSummaryStream():
+    try:
+        business_id = api.required_arg(request.args, 'businessId')
+    except Exception as e:
+        return error_response(e, '/businessSummary/stream')
+
+    app.logger.info('Received request to /businessSummary/stream')
+    return sse_response(api.summary_chunks(review_summariser.stream_summariser_business(business_id)), '/businessSummary')
+
+@llm_bp.route('/summary/locationSummary/stream')
+def locationSummaryStream():
+    try:
+        location_id = api.required_arg(request.args, 'locationId')
+    except Exception as e:
+        return error_response(e, '/locationSummary/stream')
+
+    app.logger.info('Received request to /locationSummary/stream')
+    return sse_response(api.summary_chunks(review_summariser.stream_summariser_location(location_id)), '/locationSummary')
+
+
+# Route to summarise many businesses and locations in one request
+@llm_bp.route('/summary/batch', methods=['POST'])
+def batchSummary():
+    try:
+        app.logger.info('Received request to /summary/batch')
+
+        body = request.get_json(silent=True) or {}
+        entity_ids = api.batch_entity_ids(body)
+
+        # Optionally stream one JSON line per entity as soon as its summary is ready
+        if body.get('stream'):
+            lines = api.batch_lines(review_summariser.iter_summariser_batch(entity_ids))
+            return Response(stream_with_context(lines), mimetype=api.NDJSON_MIMETYPE)
+
+        summaries, errors = review_summariser.run_summariser_batch(entity_ids)
+        return jsonify({'summaries': summaries, 'errors': errors})
+
+    except Exception as e:
+        return error_response(e, '/summary/batch')
 
 
 @llm_bp.route('/itinerary/process', methods=['POST'])
 def process_itinerary():
     try:
-        itinerary_data = request.get_json()
-        if not itinerary_data:
-            app.logger.warning('No itinerary data in the request')
-            return jsonify({'error': 'Itinerary data is required'}), 400
-        
+        itinerary_data = api.required_body(request.get_json(silent=True), 'Itinerary data is required')
         optimization = itinerary_data.get('optimization')
         itinerary_requirements = ItineraryProcessor.run(itinerary_data, optimization)
         return jsonify({'i_reqs': itinerary_requirements}), 200
 
     except Exception as e:
-        app.logger.error(f"Error in itinerary processing route: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e, '/itinerary/process')
 
 @llm_bp.route('/itinerary/processAiItinerary', methods=['POST'])
 def process_AI_itinerary():
     try:
-        query = request.get_json()
-        if not query:
-            app.logger.warning('No query in the request')
-            return jsonify({'error': 'query is required'}), 400
-        
+        query = api.required_body(request.get_json(silent=True), 'query is required')
         generated_itinerary = ItineraryAiProcessor.run(query)
         return jsonify({'generated_itinerary': generated_itinerary}), 200
 
     except Exception as e:
-        app.logger.error(f"Error in itinerary generation: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-    
+        return error_response(e, '/itinerary/processAiItinerary')
+
+# Streaming variant: emits "locations", "stops" and "itinerary_chunk" events as each stage finishes
+@llm_bp.route('/itinerary/processAiItinerary/stream', methods=['POST'])
+def process_AI_itinerary_stream():
+    try:
+        query = api.required_body(request.get_json(silent=True), 'query is required')
+    except Exception as e:
+        return error_response(e, '/itinerary/processAiItinerary/stream')
+
+    return sse_response(ItineraryAiProcessor.run_stream(query), '/processAiItinerary')
+
+# Async variant: returns a job id at once, the itinerary is generated in the background
+@llm_bp.route('/itinerary/jobs', methods=['POST'])
+def create_AI_itinerary_job():
+    try:
+        query = api.required_body(request.get_json(silent=True), 'query is required')
+        job = itinerary_jobs.get_job_manager().submit(query)
+        app.logger.info(f"Queued itinerary job {job['job_id']}")
+        body, status, headers = api.job_created(job)
+        return jsonify(body), status, headers
+
+    except Exception as e:
+        return error_response(e, '/itinerary/jobs')
+
+@llm_bp.route('/itinerary/jobs/<job_id>', methods=['GET'])
+def get_AI_itinerary_job(job_id):
+    try:
+        return jsonify(api.job_body(itinerary_jobs.get_job_manager().get(job_id))), 200
+
+    except Exception as e:
+        return error_response(e, f'/itinerary/jobs/{job_id}')
+
+# Itinerary images, rendered in this process instead of a spawned Python script per request
+@llm_bp.route('/itinerary/render', methods=['POST'])
+def render_itinerary():
+    try:
+        itinerary, template_id = api.render_request(request.get_json(silent=True) or {}, 'itinerary')
+        image = itinerary_renderer.run_render(itinerary_renderer.render_basic_itinerary, itinerary, template_id)
+        return Response(image, mimetype='image/png')
+
+    except Exception as e:
+        return error_response(e, '/itinerary/render')
+
+@llm_bp.route('/itinerary/renderAiItinerary', methods=['POST'])
+def render_AI_itinerary():
+    try:
+        query, template_id = api.render_request(request.get_json(silent=True) or {}, 'query')
+        image = itinerary_renderer.run_render(itinerary_renderer.render_ai_itinerary, query, template_id)
+        return Response(image, mimetype='image/png')
+
+    except Exception as e:
+        return error_response(e, '/itinerary/renderAiItinerary')
+
+# Fast-path, cache, prompt size and render counters for this worker process
+@llm_bp.route('/metrics')
+def metrics():
+    return jsonify(api.metrics())
+
 # Register the Blueprint with the Flask app
 app.register_blueprint(llm_bp)
 
@@ -118,9 +209,10 @@ if __name__ == '__main__':
     # Log server start
     app.logger.info("Server is starting...")
 
-    
+
     # Alternatively, if you want to use waitress:
     # from waitress import serve
     # serve(app, host='0.0.0.0', port=5000)
     # Run using Flask development server on all interfaces (0.0.0.0)
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    # For production use gunicorn (llm_server:app), or the async server in llm_asgi.py
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG') == '1')
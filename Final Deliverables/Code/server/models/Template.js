@@ -8,6 +8,7 @@ const templateSchema = new mongoose.Schema({
     name: String,
     image: Buffer, 
     type: String,
+    updatedAt: Date,
 });
 
 export const Template = mongoose.model("Template", templateSchema, "Template");
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""Offline precomputation of review summaries.
+
+Walks every Business and Location that has reviews, summarises the ones whose
+stored summary is missing, older than their newest review or past
+SUMMARY_CACHE_TTL_SECONDS, and writes the results to the summary store. Run the
+API with SUMMARY_CACHE_PERSISTENCE set to the same store (mongo by default) so
+the /summary/* routes serve these summaries instead of calling the LLM on the
+request path.
+
+The job is resumable: summaries are written as soon as each entity finishes, and
+entities whose stored summary already matches their newest review are skipped,
+so rerunning after an interruption only does the remaining work.
+
+Usage (from the server folder):
+    python summary_batch.py
+    python summary_batch.py --workers 8 --rate-limit 30 --entity-type business
+    python summary_batch.py --force --limit 100
+"""
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm_component import database, review_summariser, summary_cache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('summary_batch')
+
+# Stored summaries fetched per query when checking which entities are stale
+STALE_CHECK_BATCH_SIZE = 500
+
+
+class RateLimiter:
+    """Spaces out calls so no more than calls_per_minute start in any minute, across all threads."""
+
+    def __init__(self, calls_per_minute):
+        self.interval = 60.0 / calls_per_minute
+        self.next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self.next_slot - now
+            self.next_slot = max(self.next_slot, now) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+def find_reviewed_entities(entity_type=None, db=None):
+    """One aggregation over Review: every reviewed entity with its newest review as a watermark."""
+    if db is None:
+        db = database.get_db()
+
+    pipeline = []
+    if entity_type:
+        pipeline.append({"$match": {"entityType": entity_type}})
+    pipeline += [
+        {"$sort": {"entityId": 1, "createdAt": -1, "_id": -1}},
+        {"$group": {
+            "_id": "$entityId",
+            "entityType": {"$first": "$entityType"},
+            "latestReviewId": {"$first": "$_id"},
+            "latestCreatedAt": {"$first": "$createdAt"},
+            "reviewCount": {"$sum": 1}
+        }}
+    ]
+
+    for doc in db["Review"].aggregate(pipeline, allowDiskUse=True):
+        created_at = doc.get("latestCreatedAt")
+        yield {
+            "entity_id": str(doc["_id"]),
+            "entity_type": doc.get("entityType"),
+            "review_count": doc.get("reviewCount", 0),
+            # Same shape as summary_cache.get_review_watermark
+            "watermark": (str(doc["latestReviewId"]), created_at.isoformat() if created_at else None)
+        }
+
+def find_stale(entities, store, batch_size=STALE_CHECK_BATCH_SIZE):
+    """The entities whose stored summary is missing or out of date, one store query per batch."""
+    stale = []
+    for start in range(0, len(entities), batch_size):
+        batch = entities[start:start + batch_size]
+        entries = store.get_many([entity["entity_id"] for entity in batch])
+        # Same test as the request path, TTL included, so anything the API would miss gets refreshed here
+        stale += [entity for entity in batch if not summary_cache.is_fresh_entry(entries.get(entity["entity_id"]), entity["watermark"])]
+    return stale
+
+def summarise_entity(entity, cache, max_retries):
+    if entity["entity_type"] == "Location":
+        get_reviews = review_summariser.get_reviews_by_location
+    else:
+        get_reviews = review_summariser.get_reviews_by_business
+
+    for attempt in range(max_retries + 1):
+        try:
+            return review_summariser.run_cached_summariser(entity["entity_id"], get_reviews, cache=cache, watermark=entity["watermark"])
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            backoff = 2 ** attempt
+            logger.warning(f"{entity['entity_id']}: {str(e)} (retrying in {backoff}s)")
+            time.sleep(backoff)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="entities summarised concurrently")
+    parser.add_argument("--rate-limit", type=float, default=0, help="max LLM calls per minute across all workers (0 = unlimited)")
+    parser.add_argument("--max-retries", type=int, default=3, help="retries per entity, with exponential backoff")
+    parser.add_argument("--entity-type", choices=["business", "location", "all"], default="all")
+    parser.add_argument("--store", choices=["mongo", "disk"], default="mongo", help="where summaries are written")
+    parser.add_argument("--force", action="store_true", help="re-summarise even if the stored summary is up to date")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many entities (0 = all)")
+    parser.add_argument("--progress-every", type=float, default=10, help="seconds between progress reports")
+    args = parser.parse_args()
+
+    if args.rate_limit > 0:
+        review_summariser.llm_rate_limiter = RateLimiter(args.rate_limit)
+
+    store = summary_cache.create_summary_store(args.store)
+    # Small in-memory tier: the store is what matters for a batch run. The request path's TTL
+    # makes expired entries misses here too, so they are summarised again and rewritten.
+    cache = summary_cache.SummaryCache(max_entries=args.workers * 4, store=store)
+
+    entity_type = None if args.entity_type == "all" else args.entity_type.capitalize()
+    entities = list(find_reviewed_entities(entity_type))
+    total = len(entities)
+    todo = entities if args.force else find_stale(entities, store)
+    skipped = total - len(todo)
+    if args.limit:
+        todo = todo[:args.limit]
+    if args.force:
+        # Drop the old entries so the summariser cannot return them or fold into them
+        for entity in todo:
+            cache.invalidate(entity["entity_id"])
+
+    logger.info(f"{total} reviewed entities, {skipped} up to date, {len(todo)} to summarise in this run")
+
+    done = failed = 0
+    started = last_report = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(summarise_entity, entity, cache, args.max_retries): entity for entity in todo}
+        for future in as_completed(futures):
+            entity = futures[future]
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"{entity['entity_type']} {entity['entity_id']} failed: {str(e)}")
+
+            now = time.monotonic()
+            finished = done + failed
+            if now - last_report >= args.progress_every or finished == len(todo):
+                rate = finished / (now - started) if now > started else 0
+                eta = (len(todo) - finished) / rate if rate else 0
+                logger.info(f"{finished}/{len(todo)} processed ({done} ok, {failed} failed), {rate:.2f} entities/s, ETA {eta:.0f}s")
+                last_report = now
+
+    logger.info(f"Finished in {time.monotonic() - started:.1f}s: {done} summarised, {failed} failed, {skipped} skipped as up to date")
+    database.close_db_client()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -36,6 +36,7 @@ async function saveTemplateToDB() {
                         name,
                         image: imageBuffer,
                         type: "image/png",
+                        updatedAt: new Date(),
                     },
                 },
                 { upsert: true }
@@ -0,0 +1,35 @@
+/*
+
+Filename: itineraryRenderUtils.js
+
+This file contains the client for the LLM server's itinerary render endpoints. When LLM_SERVER_URL is set,
+itinerary images are rendered by the long-lived LLM server instead of a Python script spawned per request.
+
+*/
+
+const useLlmServerRender = () => Boolean(process.env.LLM_SERVER_URL);
+
+/**
+ * Render an itinerary image on the LLM server and send the PNG as the response
+ * @param {string} route - render route under /api/llm, e.g. "/itinerary/render"
+ * @param {object} body - JSON body for the route
+ * @param {object} res - Express response
+ */
+const sendLlmServerRender = async (route, body, res) => {
+    const response = await fetch(`${process.env.LLM_SERVER_URL}/api/llm${route}`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(body),
+    });
+
+    if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        console.error("LLM server render error:", error.error || response.status);
+        return res.status(response.status === 400 ? 400 : 500).json({ message: error.error || "Failed to render itinerary" });
+    }
+
+    res.set("Content-Type", "image/png");
+    return res.send(Buffer.from(await response.arrayBuffer()));
+};
+
+export { useLlmServerRender, sendLlmServerRender };